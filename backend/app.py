@@ -2,10 +2,14 @@
 """
 A股上市公司闪卡 - 后端API服务
 使用Flask框架提供RESTful API
+
+本模块使用包内相对导入，需通过 run.py 或 flask --app backend.app 启动，
+不能直接运行 python backend/app.py
 """
 
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, g, jsonify, request, send_from_directory
 from flask_cors import CORS
+import click
 import tushare as ts
 import pandas as pd
 import json
@@ -13,6 +17,21 @@ import os
 from datetime import datetime, timedelta
 import random
 import logging
+import sys
+import cProfile
+import hmac
+import socket
+import threading
+import time
+
+from .budget import BudgetedProxy, CallBudgetExceeded, call_budget
+from .cache_backend import create_cache_backend
+from .export import iter_gzip, iter_ndjson
+from .history import build_history_series
+from .hotness import AccessTracker, merge_exports, top_stocks
+from .screener import NUMERIC_FIELDS, ScreenerTable
+from .snapshot import SnapshotStore, build_snapshot
+from .tracing import TracedProxy, end_trace, span, start_trace
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -24,31 +43,74 @@ CORS(app)
 # Tushare配置
 TUSHARE_TOKEN = ''
 ts.set_token(TUSHARE_TOKEN)
-pro = ts.pro_api()
+pro = BudgetedProxy(TracedProxy(ts.pro_api(), 'tushare'))
+
+# 追踪配置：开启后每个请求返回 Server-Timing 头并记录结构化日志
+TRACING_ENABLED = os.environ.get('TRACING', 'False').lower() == 'true'
+# 管理员令牌：请求带 ?profile=1 和 X-Admin-Token 头时对该请求做CPU采样，未设置则禁用
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
 
 # 缓存配置
 CACHE_DIR = 'cache'
 CACHE_TTL = 24  # 小时
 HISTORICAL_CACHE_TTL = 7 * 24  # 历史数据缓存7天
-STOCK_LIST_FILE = os.path.join(CACHE_DIR, 'stock_list.json')
-STOCK_DATA_DIR = os.path.join(CACHE_DIR, 'stocks')
-HISTORICAL_DATA_DIR = os.path.join(CACHE_DIR, 'historical')
+STOCK_LIST_KEY = 'stock_list'
+STOCK_DATA_PREFIX = 'stocks/'
+HISTORICAL_DATA_PREFIX = 'historical/'
+HISTORY_SERIES_PREFIX = 'history/'
+HISTORY_POINTS_DEFAULT = 120  # 走势图默认点数
+HISTORY_POINTS_LEVELS = (60, 120, 250, 500)  # 可用的点数档位，请求的点数向上取到最近的档位
+MARKET_DATA_PREFIX = 'market/'
+TRADE_CALENDAR_KEY = f'{MARKET_DATA_PREFIX}trade_cal'
+DAILY_BASIC_KEY = f'{MARKET_DATA_PREFIX}daily_basic'  # 只保留最新一个交易日的全市场估值
+MARKET_DATA_READY_HOUR = 17  # 当天收盘数据的发布时间（点）
+TRADE_CALENDAR_RETRY_SECONDS = 60  # 交易日历获取失败后的重试间隔
+TIER_DATA_PREFIX = 'tiers/'
+TIER_TTL_DAYS = {'profile': 30, 'holder': 7}  # 公司资料和股东数据的有效天数
+FUNDAMENTALS_RECHECK_HOURS = 24  # 新报告期可能已发布时，检查财报的间隔
+TIER_RETRY_HOURS = 1  # 某层数据刷新失败后，沿用旧数据或默认值、暂不重试的时间
+TIER_STORE_TTL_DAYS = 180  # 分层数据在缓存后端中的保留时间
+
+# 热门股票预热配置
+HOTNESS_PREFIX = 'hotness/'
+HOTNESS_HALF_LIFE_HOURS = 24  # 访问热度的半衰期
+HOTNESS_FLUSH_INTERVAL = 60  # 各进程把访问计数写入共享缓存的间隔（秒）
+HOTNESS_EXPORT_MAX_AGE = HOTNESS_HALF_LIFE_HOURS * 4 * 3600  # 进程的访问计数超过该时间（秒）未更新时删除
+FAVORITE_WEIGHT = 3  # 收藏列表中的股票每次上报计入的访问次数
+PREWARM_ENABLED = os.environ.get('PREWARM', 'False').lower() == 'true'  # 在本进程内定时预热
+PREWARM_TOP_N = int(os.environ.get('PREWARM_TOP_N', 200))  # 预热最热门的N只股票
+PREWARM_BUDGET = int(os.environ.get('PREWARM_BUDGET', 500))  # 每轮预热最多使用的Tushare调用次数
+PREWARM_LEAD_HOURS = 2  # 提前刷新将在该小时数内过期的数据
+PREWARM_INTERVAL = 15 * 60  # 预热间隔（秒）
+SCREENER_TTL = 30 * 60  # 选股表重建间隔（秒）
+SCREENER_RETRY_SECONDS = 60  # 股票列表或全市场估值为空时，选股表的重建间隔（秒）
+
+# 缓存后端：file（本地文件，默认）/ sqlite（同机多进程共享）/ redis（多机共享）
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'file')
+CACHE_URL = os.environ.get('CACHE_URL', '')
+cache = TracedProxy(create_cache_backend(CACHE_BACKEND, CACHE_DIR, CACHE_URL), 'cache')
 
-# 确保缓存目录存在
-os.makedirs(CACHE_DIR, exist_ok=True)
-os.makedirs(STOCK_DATA_DIR, exist_ok=True)
-os.makedirs(HISTORICAL_DATA_DIR, exist_ok=True)
+# 每日卡片快照（由 build-snapshot 命令生成，各worker通过mmap共享）
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(CACHE_DIR, 'snapshots'))
+snapshot_store = SnapshotStore(SNAPSHOT_DIR, max_age_hours=CACHE_TTL)
+
+# 进程内的交易日历：(日期, 交易日列表, 获取失败后下次重试的时间)
+_trade_calendar = (None, [], 0)
+
+# 进程内的访问计数，定期写入缓存后端供预热任务汇总
+access_tracker = AccessTracker(half_life=HOTNESS_HALF_LIFE_HOURS * 3600)
+_access_flushed_at = 0
 
 
 def get_stock_list():
     """获取所有A股股票列表"""
-    if os.path.exists(STOCK_LIST_FILE):
-        with open(STOCK_LIST_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            # 检查缓存是否过期
-            cache_time = datetime.fromisoformat(data['cache_time'])
-            if datetime.now() - cache_time < timedelta(hours=CACHE_TTL):
-                return data['stocks']
+    data = cache.get(STOCK_LIST_KEY)
+    if data:
+        # 检查缓存是否过期
+        cache_time = datetime.fromisoformat(data['cache_time'])
+        if datetime.now() - cache_time < timedelta(hours=CACHE_TTL):
+            return data['stocks']
     
     try:
         # 从Tushare获取股票列表
@@ -62,8 +124,7 @@ def get_stock_list():
             'cache_time': datetime.now().isoformat(),
             'stocks': stocks
         }
-        with open(STOCK_LIST_FILE, 'w', encoding='utf-8') as f:
-            json.dump(cache_data, f, ensure_ascii=False, indent=2)
+        cache.set(STOCK_LIST_KEY, cache_data, ttl=CACHE_TTL * 2 * 3600)
         
         logger.info(f"成功获取 {len(stocks)} 只股票")
         return stocks
@@ -72,105 +133,84 @@ def get_stock_list():
         return []
 
 
-def get_stock_cache_path(ts_code):
-    """获取股票缓存文件路径"""
-    return os.path.join(STOCK_DATA_DIR, f'{ts_code}.json')
+def get_stock_cache_key(ts_code):
+    """获取股票缓存键"""
+    return f'{STOCK_DATA_PREFIX}{ts_code}'
 
 
-def is_cache_valid(cache_path):
-    """检查缓存是否有效（24小时内）"""
-    if not os.path.exists(cache_path):
+def is_cache_valid(data, lead=timedelta(0)):
+    """检查缓存的股票数据是否有效（组成卡片的每一层都未过期）
+
+    lead: 提前量，按时间过期的数据层在 lead 之内将过期时也视为无效
+    """
+    if not data:
         return False
     
     try:
-        with open(cache_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            
-        # 检查是否有缓存时间字段
-        if 'cached_time' not in data:
-            logger.warning(f"缓存文件缺少时间戳: {cache_path}")
+        # 旧格式的缓存没有分层时间戳，需要重新组装
+        if 'tiers' not in data:
+            logger.debug(f"缓存数据缺少分层时间戳: {data.get('ts_code')}")
             return False
-            
-        # 解析缓存时间
-        cache_time = datetime.fromisoformat(data['cached_time'])
-        current_time = datetime.now()
-        time_diff = current_time - cache_time
         
-        # 检查是否在24小时内
-        is_valid = time_diff < timedelta(hours=CACHE_TTL)
+        latest_trade_date, _ = get_latest_trade_dates()
+        stale_tiers = [
+            tier for tier in CARD_TIERS
+            if not is_tier_fresh(tier, data['tiers'].get(tier), latest_trade_date, lead)
+        ]
         
-        if is_valid:
-            logger.debug(f"缓存有效: {cache_path}, 缓存时间: {cache_time}, 剩余: {timedelta(hours=CACHE_TTL) - time_diff}")
+        if stale_tiers:
+            logger.debug(f"缓存过期: {data['ts_code']}, 过期的数据层: {stale_tiers}")
         else:
-            logger.debug(f"缓存过期: {cache_path}, 缓存时间: {cache_time}, 过期: {time_diff - timedelta(hours=CACHE_TTL)}")
+            logger.debug(f"缓存有效: {data['ts_code']}, 交易日: {data.get('trade_date')}")
             
-        return is_valid
+        return not stale_tiers
         
-    except (json.JSONDecodeError, ValueError, KeyError) as e:
-        logger.error(f"缓存文件格式错误: {cache_path}, 错误: {e}")
-        return False
-    except Exception as e:
-        logger.error(f"读取缓存文件失败: {cache_path}, 错误: {e}")
+    except (ValueError, KeyError, TypeError) as e:
+        logger.error(f"缓存数据格式错误: {data.get('ts_code')}, 错误: {e}")
         return False
 
 
 def clean_expired_cache():
-    """清理过期的缓存文件"""
+    """清理过期的缓存"""
     try:
-        if not os.path.exists(STOCK_DATA_DIR):
-            return
-        
-        current_time = datetime.now()
-        cleaned_count = 0
-        
-        for filename in os.listdir(STOCK_DATA_DIR):
-            if filename.endswith('.json'):
-                file_path = os.path.join(STOCK_DATA_DIR, filename)
-                try:
-                    # 检查文件修改时间
-                    file_mtime = datetime.fromtimestamp(os.path.getmtime(file_path))
-                    if current_time - file_mtime > timedelta(hours=CACHE_TTL * 2):  # 超过2倍缓存时间才删除
-                        os.remove(file_path)
-                        cleaned_count += 1
-                        logger.info(f"删除过期缓存: {filename}")
-                except Exception as e:
-                    logger.error(f"删除缓存文件失败 {filename}: {e}")
+        # 超过2倍缓存时间才删除
+        cleaned_count = cache.purge_expired(STOCK_DATA_PREFIX, max_age=CACHE_TTL * 2 * 3600)
         
         if cleaned_count > 0:
-            logger.info(f"清理完成，删除了 {cleaned_count} 个过期缓存文件")
+            logger.info(f"清理完成，删除了 {cleaned_count} 个过期缓存")
         else:
-            logger.info("没有发现过期的缓存文件")
+            logger.info("没有发现过期的缓存")
             
     except Exception as e:
         logger.error(f"清理缓存时发生错误: {e}")
 
 
-def get_historical_cache_path(ts_code):
-    """获取历史数据缓存文件路径"""
-    return os.path.join(HISTORICAL_DATA_DIR, f'{ts_code}_historical.json')
+def get_historical_cache_key(ts_code):
+    """获取历史数据缓存键"""
+    return f'{HISTORICAL_DATA_PREFIX}{ts_code}_historical'
 
 
-def is_historical_cache_valid(cache_path):
+def is_historical_cache_valid(data):
     """检查历史数据缓存是否有效"""
-    if not os.path.exists(cache_path):
+    if not data or 'cache_time' not in data:
         return False
     
     try:
-        file_mtime = datetime.fromtimestamp(os.path.getmtime(cache_path))
-        return datetime.now() - file_mtime < timedelta(hours=HISTORICAL_CACHE_TTL)
-    except:
+        cache_time = datetime.fromisoformat(data['cache_time'])
+        return datetime.now() - cache_time < timedelta(hours=HISTORICAL_CACHE_TTL)
+    except ValueError:
         return False
 
 
-def get_historical_financial_data(ts_code):
+def get_historical_financial_data(ts_code, refresh=False):
     """获取股票历史财务数据（过去5年，如果不足5年则获取所有可用数据）"""
-    cache_path = get_historical_cache_path(ts_code)
+    cache_key = get_historical_cache_key(ts_code)
     
     # 检查缓存
-    if is_historical_cache_valid(cache_path):
+    cached_data = None if refresh else cache.get(cache_key)
+    if is_historical_cache_valid(cached_data):
         logger.info(f"从缓存读取历史数据 {ts_code}")
-        with open(cache_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return cached_data
     
     try:
         logger.info(f"从Tushare获取历史数据 {ts_code}")
@@ -279,6 +319,7 @@ def get_historical_financial_data(ts_code):
             'roe_data': roe_data,
             'debt_to_asset_data': debt_to_asset_data,
             'gross_profit_margin_data': gross_profit_margin_data,
+            'valuation_series': {'trade_date': [], 'pe': [], 'pb': []},
             'averages': {},
             'cache_time': datetime.now().isoformat()
         }
@@ -295,6 +336,16 @@ def get_historical_financial_data(ts_code):
             historical_data['pe_data'] = pe_values.tolist()
             historical_data['pb_data'] = pb_values.tolist()
             
+            # 按日期保存PE、PB序列（异常值记为空），供历史走势图使用
+            dated = daily_data.sort_values('trade_date')
+            pe_series = dated['pe'].where((dated['pe'] > 0) & (dated['pe'] < 1000))
+            pb_series = dated['pb'].where((dated['pb'] > 0) & (dated['pb'] < 100))
+            historical_data['valuation_series'] = {
+                'trade_date': dated['trade_date'].astype(str).tolist(),
+                'pe': [None if pd.isna(v) else float(v) for v in pe_series],
+                'pb': [None if pd.isna(v) else float(v) for v in pb_series]
+            }
+            
             # 计算平均值
             if len(pe_values) > 0:
                 historical_data['averages']['pe'] = float(pe_values.mean())
@@ -320,8 +371,7 @@ def get_historical_financial_data(ts_code):
                 historical_data['averages']['gross_profit_margin'] = sum(margin_values) / len(margin_values)
         
         # 保存缓存
-        with open(cache_path, 'w', encoding='utf-8') as f:
-            json.dump(historical_data, f, ensure_ascii=False, indent=2)
+        cache.set(cache_key, historical_data, ttl=HISTORICAL_CACHE_TTL * 2 * 3600)
         
         logger.info(f"历史数据获取成功: {ts_code}")
         return historical_data
@@ -331,6 +381,34 @@ def get_historical_financial_data(ts_code):
         return None
 
 
+def get_stock_history(ts_code, points):
+    """获取降采样后的历史估值序列，每种点数单独缓存"""
+    historical_data = get_historical_financial_data(ts_code)
+    if historical_data and 'valuation_series' not in historical_data:
+        # 旧版本缓存没有带日期的序列，重新获取一次
+        historical_data = get_historical_financial_data(ts_code, refresh=True) or historical_data
+    if not historical_data:
+        return None
+    
+    cache_key = f'{HISTORY_SERIES_PREFIX}{ts_code}_{points}'
+    cached_data = cache.get(cache_key)
+    if cached_data and cached_data.get('source_cache_time') == historical_data.get('cache_time'):
+        return cached_data
+    
+    with span('downsample'):
+        series = build_history_series(historical_data, points)
+    
+    data = {
+        'ts_code': ts_code,
+        'points': points,
+        'series': series,
+        'averages': historical_data.get('averages', {}),
+        'source_cache_time': historical_data.get('cache_time')
+    }
+    cache.set(cache_key, data, ttl=HISTORICAL_CACHE_TTL * 3600)
+    return data
+
+
 def calculate_percentile_vs_history(current_value, historical_data, metric):
     """计算当前值相对于历史数据的百分位"""
     if not historical_data or metric not in historical_data.get('averages', {}):
@@ -362,79 +440,192 @@ def calculate_percentile_vs_history(current_value, historical_data, metric):
     }
 
 
-def get_stock_basic_info(ts_code):
-    """获取股票基本信息"""
-    try:
-        # 获取主营业务信息 - 增加重试机制
-        business_info = {
-            'main_business': '',
-            'business_scope': '',
-            'introduction': ''
-        }
-        
+def get_trade_calendar():
+    """获取近30天的交易日列表（升序），每天只从Tushare获取一次，各进程通过缓存共享"""
+    global _trade_calendar
+    today = datetime.now().strftime('%Y%m%d')
+    if _trade_calendar[0] == today or time.time() < _trade_calendar[2]:
+        return _trade_calendar[1]
+    
+    data = cache.get(TRADE_CALENDAR_KEY)
+    if not data or data.get('cache_date') != today:
         try:
-            basic_df = pro.stock_company(ts_code=ts_code, 
-                                         fields='ts_code,chairman,manager,secretary,reg_capital,setup_date,province,city,website,email,office,business_scope,main_business,introduction')
-            
-            if not basic_df.empty:
-                business_info = {
-                    'main_business': basic_df.iloc[0].get('main_business', ''),
-                    'business_scope': basic_df.iloc[0].get('business_scope', ''),
-                    'introduction': basic_df.iloc[0].get('introduction', '')
-                }
+            # 扩大查询范围到30天，确保能获取到最新交易日
+            trade_cal = pro.trade_cal(exchange='', is_open='1', 
+                                      start_date=(datetime.now() - timedelta(days=30)).strftime('%Y%m%d'),
+                                      end_date=today)
         except Exception as e:
-            logger.warning(f"获取公司信息失败: {e}")
-            # 使用概念信息作为降级策略
-            try:
-                concept_df = pro.concept_detail(ts_code=ts_code)
-                if not concept_df.empty:
-                    business_info['main_business'] = concept_df.iloc[0].get('concept_name', '')
-            except Exception as e2:
-                logger.warning(f"获取概念信息失败: {e2}")
-        
-        # 股票基础信息 - 增加重试机制
-        stock_basic_df = None
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                stock_basic_df = pro.stock_basic(ts_code=ts_code, 
-                                                fields='ts_code,symbol,name,area,industry,market,list_date')
-                if not stock_basic_df.empty:
-                    break
-                else:
-                    logger.warning(f"股票 {ts_code} 基础信息为空，尝试 {attempt + 1}/{max_retries}")
-            except Exception as e:
-                logger.warning(f"获取股票基础信息失败 (尝试 {attempt + 1}/{max_retries}): {e}")
-                if attempt < max_retries - 1:
-                    import time
-                    time.sleep(1)  # 等待1秒后重试
+            logger.error(f"获取交易日历失败: {e}")
+            trade_cal = None
         
-        if stock_basic_df is None or stock_basic_df.empty:
-            logger.error(f"无法获取股票 {ts_code} 的基础信息")
-            return None
-        
-        basic_info = stock_basic_df.iloc[0].to_dict()
-        
-        # 获取最新交易日期（扩大查询范围到30天，确保能获取到最新交易日）
-        trade_cal = pro.trade_cal(exchange='', is_open='1', 
-                                  start_date=(datetime.now() - timedelta(days=30)).strftime('%Y%m%d'),
-                                  end_date=datetime.now().strftime('%Y%m%d'))
-        if trade_cal.empty:
-            logger.error("无法获取交易日历")
-            return None
+        if trade_cal is None or trade_cal.empty:
+            if trade_cal is not None:
+                logger.error("无法获取交易日历")
+            # 记住失败，在重试间隔内沿用旧的日历（没有则为空），避免每次检查缓存都调用接口
+            dates = data['dates'] if data else []
+            _trade_calendar = (None, dates, time.time() + TRADE_CALENDAR_RETRY_SECONDS)
+            return dates
         
-        # 按日期排序，确保获取真正的最新交易日
-        trade_cal = trade_cal.sort_values('cal_date')
-        latest_trade_date = trade_cal.iloc[-1]['cal_date']
-        prev_trade_date = trade_cal.iloc[-2]['cal_date'] if len(trade_cal) > 1 else latest_trade_date
-        
-        logger.info(f"获取到最新交易日: {latest_trade_date}, 前一交易日: {prev_trade_date}")
+        data = {
+            'cache_date': today,
+            'dates': sorted(trade_cal['cal_date'].astype(str).tolist())
+        }
+        cache.set(TRADE_CALENDAR_KEY, data, ttl=CACHE_TTL * 2 * 3600)
+    
+    _trade_calendar = (today, data['dates'], 0)
+    return data['dates']
+
+
+def get_latest_trade_dates():
+    """获取最新一个已发布收盘数据的交易日和前一交易日，失败时返回 (None, None)"""
+    now = datetime.now()
+    today = now.strftime('%Y%m%d')
+    # 当天的收盘数据在 MARKET_DATA_READY_HOUR 点之后才会发布
+    published = [
+        d for d in get_trade_calendar()
+        if d < today or (d == today and now.hour >= MARKET_DATA_READY_HOUR)
+    ]
+    if not published:
+        return None, None
+    
+    latest_trade_date = published[-1]
+    prev_trade_date = published[-2] if len(published) > 1 else latest_trade_date
+    return latest_trade_date, prev_trade_date
+
+
+def get_recent_report_periods(count=5):
+    """最近已结束的报告期（季度末），从新到旧"""
+    today = datetime.now()
+    quarter_ends = ['0331', '0630', '0930', '1231']
+    year, quarter = today.year, (today.month - 1) // 3
+    periods = []
+    for _ in range(count):
+        if quarter == 0:
+            year, quarter = year - 1, 4
+        periods.append(f'{year}{quarter_ends[quarter - 1]}')
+        quarter -= 1
+    return periods
+
+
+def get_next_report_period(period):
+    """某个报告期之后的下一个报告期"""
+    year, month_day = int(period[:4]), period[4:]
+    next_month_day = {'0331': '0630', '0630': '0930', '0930': '1231'}.get(month_day)
+    return f'{year}{next_month_day}' if next_month_day else f'{year + 1}0331'
+
+
+def get_tier_cache_key(tier, ts_code):
+    """获取卡片分层数据的缓存键"""
+    return f'{TIER_DATA_PREFIX}{tier}/{ts_code}'
+
+
+def is_tier_fresh(tier, entry, latest_trade_date, lead=timedelta(0)):
+    """检查一层数据是否仍然有效
+
+    - market: 已是最新一个已发布交易日的数据（新数据发布前无法提前刷新，不受 lead 影响）
+    - fundamentals: 下一个报告期还没结束，或距上次检查不足 FUNDAMENTALS_RECHECK_HOURS
+    - profile / holder: 在 TIER_TTL_DAYS 天之内
+    - 上次刷新失败的层在 retry_after 之前都视为有效，避免每次请求都重复失败的调用
+    """
+    if not entry:
+        return False
+    
+    now = datetime.now()
+    retry_after = entry.get('retry_after')
+    if retry_after and now + lead < datetime.fromisoformat(retry_after):
+        return True
+    if 'fetched_time' not in entry:
+        return False
+    
+    age = now - datetime.fromisoformat(entry['fetched_time'])
+    
+    if tier == 'market':
+        if latest_trade_date is None:
+            # 交易日历不可用时退回按时间判断
+            return age < timedelta(hours=CACHE_TTL)
+        return (entry.get('trade_date') or '') >= latest_trade_date
+    
+    # 按到 now + lead 时的状态判断
+    age += lead
+    if tier == 'fundamentals':
+        period = entry.get('period')
+        if period and get_next_report_period(period) >= (now + lead).strftime('%Y%m%d'):
+            return True
+        return age < timedelta(hours=FUNDAMENTALS_RECHECK_HOURS)
+    
+    return age < timedelta(days=TIER_TTL_DAYS[tier])
+
+
+def fetch_profile_tier(ts_code, previous=None):
+    """公司资料：主营业务和股票基础信息，几乎不变"""
+    # 获取主营业务信息 - 增加重试机制
+    business_info = {
+        'main_business': '',
+        'business_scope': '',
+        'introduction': ''
+    }
+    
+    try:
+        basic_df = pro.stock_company(ts_code=ts_code, 
+                                     fields='ts_code,chairman,manager,secretary,reg_capital,setup_date,province,city,website,email,office,business_scope,main_business,introduction')
         
+        if not basic_df.empty:
+            business_info = {
+                'main_business': basic_df.iloc[0].get('main_business', ''),
+                'business_scope': basic_df.iloc[0].get('business_scope', ''),
+                'introduction': basic_df.iloc[0].get('introduction', '')
+            }
+    except Exception as e:
+        logger.warning(f"获取公司信息失败: {e}")
+        # 使用概念信息作为降级策略
+        try:
+            concept_df = pro.concept_detail(ts_code=ts_code)
+            if not concept_df.empty:
+                business_info['main_business'] = concept_df.iloc[0].get('concept_name', '')
+        except Exception as e2:
+            logger.warning(f"获取概念信息失败: {e2}")
+    
+    # 股票基础信息 - 增加重试机制
+    stock_basic_df = None
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            stock_basic_df = pro.stock_basic(ts_code=ts_code, 
+                                            fields='ts_code,symbol,name,area,industry,market,list_date')
+            if not stock_basic_df.empty:
+                break
+            else:
+                logger.warning(f"股票 {ts_code} 基础信息为空，尝试 {attempt + 1}/{max_retries}")
+        except Exception as e:
+            logger.warning(f"获取股票基础信息失败 (尝试 {attempt + 1}/{max_retries}): {e}")
+            if attempt < max_retries - 1:
+                time.sleep(1)  # 等待1秒后重试
+    
+    if stock_basic_df is None or stock_basic_df.empty:
+        logger.error(f"无法获取股票 {ts_code} 的基础信息")
+        return None
+    
+    return {
+        'data': {
+            'basic': stock_basic_df.iloc[0].to_dict(),
+            'business': business_info
+        },
+        'fetched_time': datetime.now().isoformat()
+    }
+
+
+def fetch_market_tier(ts_code, previous=None):
+    """行情数据：最新交易日的价格、市值和估值"""
+    latest_trade_date, _ = get_latest_trade_dates()
+    if latest_trade_date is None:
+        logger.error("无法获取交易日历")
+        return None
+    
+    try:
         # 获取最新价格
         daily_df = pro.daily(ts_code=ts_code, trade_date=latest_trade_date,
                             fields='close,pre_close,pct_chg')
         
-        price_info = {}
         if not daily_df.empty:
             price_info = {
                 'price': round(daily_df.iloc[0]['close'], 2),
@@ -447,7 +638,6 @@ def get_stock_basic_info(ts_code):
         # 获取市值数据
         daily_basic_df = pro.daily_basic(ts_code=ts_code, trade_date=latest_trade_date,
                                          fields='total_mv,circ_mv,pe,pb,total_share')
-        market_info = {}
         total_share = 0
         if not daily_basic_df.empty:
             total_mv = daily_basic_df.iloc[0]['total_mv']
@@ -459,82 +649,202 @@ def get_stock_basic_info(ts_code):
             }
         else:
             market_info = {'market_value': 0, 'pe': 0, 'pb': 0}
-        
-        # 获取股东数据
-        holder_info = {'holder_num': 0, 'holder_avg_amount': 0}
-        try:
-            # 获取最近的股东数据
-            end_date = datetime.now().strftime('%Y%m%d')
-            start_date = (datetime.now() - timedelta(days=180)).strftime('%Y%m%d')
-            holder_df = pro.stk_holdernumber(ts_code=ts_code, start_date=start_date, end_date=end_date)
+    except Exception as e:
+        logger.warning(f"获取 {ts_code} 行情数据失败: {e}")
+        return None
+    
+    return {
+        'data': {
+            'price': price_info,
+            'market': market_info,
+            'total_share': total_share
+        },
+        'trade_date': latest_trade_date,
+        'fetched_time': datetime.now().isoformat()
+    }
+
+
+def fetch_holder_tier(ts_code, previous=None):
+    """股东数据：最近的股东户数"""
+    try:
+        # 获取最近的股东数据
+        end_date = datetime.now().strftime('%Y%m%d')
+        start_date = (datetime.now() - timedelta(days=180)).strftime('%Y%m%d')
+        holder_df = pro.stk_holdernumber(ts_code=ts_code, start_date=start_date, end_date=end_date)
+    except Exception as e:
+        logger.warning(f"获取股东数据失败: {e}")
+        return None
+    
+    holder_num = 0
+    if not holder_df.empty:
+        # 取最新的数据
+        value = holder_df.iloc[0].get('holder_num', 0)
+        if value and value > 0:
+            holder_num = int(value)
+    
+    return {
+        'data': {'holder_num': holder_num},
+        'fetched_time': datetime.now().isoformat()
+    }
+
+
+def fetch_fundamentals_tier(ts_code, previous=None):
+    """财务数据（ROE、毛利率、资产负债率）- 使用最新报告期
+
+    已有数据时只查询比它更新的报告期，没有新报告期时沿用原数据并更新检查时间。
+    """
+    periods = get_recent_report_periods()
+    previous_period = previous.get('period') if previous else None
+    if previous_period:
+        periods = [p for p in periods if p > previous_period]
+    
+    roe = 0
+    gross_profit_margin = 0
+    debt_to_asset_ratio = 0
+    found_period = None
+    
+    try:
+        for period in periods:
+            # 获取ROE和资产负债率
+            fina_df = pro.fina_indicator(ts_code=ts_code, period=period, fields='roe,debt_to_assets')
+            if not fina_df.empty:
+                found_period = found_period or period
+                if fina_df.iloc[0]['roe'] and roe == 0:
+                    roe = round(fina_df.iloc[0]['roe'], 2)
+                if fina_df.iloc[0]['debt_to_assets'] and debt_to_asset_ratio == 0:
+                    debt_to_asset_ratio = round(fina_df.iloc[0]['debt_to_assets'], 2)
             
-            if not holder_df.empty:
-                # 取最新的数据
-                latest_holder = holder_df.iloc[0]
-                holder_num = latest_holder.get('holder_num', 0)
+            # 获取毛利率（从利润表）
+            income_df = pro.income(ts_code=ts_code, period=period, fields='revenue,oper_cost')
+            if not income_df.empty and gross_profit_margin == 0:
+                found_period = found_period or period
+                revenue = income_df.iloc[0]['revenue']
+                oper_cost = income_df.iloc[0]['oper_cost']
+                if revenue and oper_cost and revenue > 0:
+                    gross_profit_margin = round(((revenue - oper_cost) / revenue) * 100, 2)
+            
+            # 如果所有数据都获取到了，就退出循环
+            if roe != 0 and gross_profit_margin != 0 and debt_to_asset_ratio != 0:
+                break
                 
-                if holder_num and holder_num > 0 and total_share and total_share > 0:
-                    # 计算平均每个股东持股数量
-                    avg_shares = total_share / holder_num
-                    # 计算平均持股金额（股数 × 股价）
-                    avg_amount = avg_shares * price_info.get('price', 0)
-                    
-                    holder_info = {
-                        'holder_num': int(holder_num),
-                        'holder_avg_amount': round(avg_amount, 2)
-                    }
-        except Exception as e:
-            logger.warning(f"获取股东数据失败: {e}")
+    except Exception as e:
+        logger.warning(f"获取财务数据失败: {e}")
+        if found_period is None:
+            return None
+    
+    if found_period is None and previous:
+        # 还没有新的报告期发布
+        return dict(previous, fetched_time=datetime.now().isoformat())
+    
+    data = {
+        'roe': roe,
+        'gross_profit_margin': gross_profit_margin,
+        'debt_to_asset_ratio': debt_to_asset_ratio
+    }
+    if previous:
+        # 新报告期只披露了部分指标时，缺少的指标沿用较早报告期的数据
+        for field, value in data.items():
+            if value == 0:
+                data[field] = previous['data'].get(field, 0)
+    
+    return {
+        'data': data,
+        'period': found_period,
+        'fetched_time': datetime.now().isoformat()
+    }
+
+
+# 卡片分层：每层单独缓存和刷新，profile 和 market 获取失败且无旧数据时整张卡片不可用
+CARD_TIERS = {
+    'profile': fetch_profile_tier,
+    'market': fetch_market_tier,
+    'holder': fetch_holder_tier,
+    'fundamentals': fetch_fundamentals_tier
+}
+TIER_DEFAULTS = {
+    'holder': {'holder_num': 0},
+    'fundamentals': {'roe': 0, 'gross_profit_margin': 0, 'debt_to_asset_ratio': 0}
+}
+
+
+def get_card_tiers(ts_code, lead=timedelta(0)):
+    """读取卡片的各层数据，只刷新已过期（或在 lead 之内将过期）的层"""
+    latest_trade_date, _ = get_latest_trade_dates()
+    tiers = {}
+    
+    for tier, fetch_tier in CARD_TIERS.items():
+        cache_key = get_tier_cache_key(tier, ts_code)
+        entry = cache.get(cache_key)
         
-        # 获取财务数据（ROE、毛利率、资产负债率）- 使用最新报告期
-        roe = 0
-        gross_profit_margin = 0
-        debt_to_asset_ratio = 0
+        if not is_tier_fresh(tier, entry, latest_trade_date, lead):
+            logger.info(f"从Tushare刷新 {ts_code} 的 {tier} 数据")
+            new_entry = fetch_tier(ts_code, entry)
+            if new_entry is not None:
+                new_entry.pop('retry_after', None)
+                entry = new_entry
+                cache.set(cache_key, entry, ttl=TIER_STORE_TTL_DAYS * 24 * 3600)
+            elif entry or tier in TIER_DEFAULTS:
+                # 获取失败时沿用过期数据（没有时用默认值），记下重试时间一起缓存，
+                # 例如没有 stk_holdernumber 接口权限时不会每次请求都重新组装卡片
+                logger.warning(f"刷新 {ts_code} 的 {tier} 数据失败，{TIER_RETRY_HOURS} 小时后重试")
+                retry_after = datetime.now() + timedelta(hours=TIER_RETRY_HOURS)
+                entry = dict(entry or {'data': TIER_DEFAULTS[tier]}, retry_after=retry_after.isoformat())
+                cache.set(cache_key, entry, ttl=TIER_STORE_TTL_DAYS * 24 * 3600)
         
-        try:
-            # 获取最近的财务指标数据
-            current_year = datetime.now().year
-            periods = [f'{current_year}0930', f'{current_year}0630', f'{current_year}0331', 
-                      f'{current_year-1}1231', f'{current_year-1}0930']
+        if entry is None:
+            return None
+        tiers[tier] = entry
+    
+    return tiers
+
+
+def get_stock_basic_info(ts_code, lead=timedelta(0)):
+    """获取股票基本信息（由各层缓存组装，只从Tushare刷新过期的层）"""
+    try:
+        tiers = get_card_tiers(ts_code, lead)
+        if tiers is None:
+            return None
+        
+        profile = tiers['profile']['data']
+        market = tiers['market']['data']
+        holder_num = tiers['holder']['data']['holder_num']
+        fundamentals = tiers['fundamentals']['data']
+        price_info = market['price']
+        market_info = market['market']
+        total_share = market['total_share']
+        
+        # 股东数据
+        holder_info = {'holder_num': 0, 'holder_avg_amount': 0}
+        if holder_num and holder_num > 0 and total_share and total_share > 0:
+            # 计算平均每个股东持股数量
+            avg_shares = total_share / holder_num
+            # 计算平均持股金额（股数 × 股价）
+            avg_amount = avg_shares * price_info.get('price', 0)
             
-            for period in periods:
-                # 获取ROE和资产负债率
-                fina_df = pro.fina_indicator(ts_code=ts_code, period=period, fields='roe,debt_to_assets')
-                if not fina_df.empty:
-                    if fina_df.iloc[0]['roe'] and roe == 0:
-                        roe = round(fina_df.iloc[0]['roe'], 2)
-                    if fina_df.iloc[0]['debt_to_assets'] and debt_to_asset_ratio == 0:
-                        debt_to_asset_ratio = round(fina_df.iloc[0]['debt_to_assets'], 2)
-                
-                # 获取毛利率（从利润表）
-                income_df = pro.income(ts_code=ts_code, period=period, fields='revenue,oper_cost')
-                if not income_df.empty and gross_profit_margin == 0:
-                    revenue = income_df.iloc[0]['revenue']
-                    oper_cost = income_df.iloc[0]['oper_cost']
-                    if revenue and oper_cost and revenue > 0:
-                        gross_profit_margin = round(((revenue - oper_cost) / revenue) * 100, 2)
-                
-                # 如果所有数据都获取到了，就退出循环
-                if roe != 0 and gross_profit_margin != 0 and debt_to_asset_ratio != 0:
-                    break
-                    
-        except Exception as e:
-            logger.warning(f"获取财务数据失败: {e}")
+            holder_info = {
+                'holder_num': int(holder_num),
+                'holder_avg_amount': round(avg_amount, 2)
+            }
         
         return {
-            'basic': basic_info,
-            'business': business_info,
+            'basic': profile['basic'],
+            'business': profile['business'],
             'price': price_info,
             'market': market_info,
             'holder': holder_info,
             'financial': {
-                'roe': roe,
+                'roe': fundamentals['roe'],
                 'pe': market_info['pe'],
                 'pb': market_info['pb'],
-                'gross_profit_margin': gross_profit_margin,
-                'debt_to_asset_ratio': debt_to_asset_ratio
+                'gross_profit_margin': fundamentals['gross_profit_margin'],
+                'debt_to_asset_ratio': fundamentals['debt_to_asset_ratio']
             },
-            'trade_date': latest_trade_date
+            'trade_date': tiers['market'].get('trade_date'),
+            # 各层的时间戳，用于判断整张卡片是否有效
+            'tiers': {
+                tier: {k: v for k, v in entry.items() if k != 'data'}
+                for tier, entry in tiers.items()
+            }
         }
     except Exception as e:
         logger.error(f"获取股票 {ts_code} 基本信息失败: {e}")
@@ -542,33 +852,32 @@ def get_stock_basic_info(ts_code):
 
 
 
+def get_stock_data(ts_code, lead=timedelta(0)):
+    """获取股票完整数据（分层缓存优先策略）
 
-def get_stock_data(ts_code):
-    """获取股票完整数据（24小时缓存优先策略）"""
-    cache_path = get_stock_cache_path(ts_code)
+    lead: 预热时使用，把在 lead 之内将过期的数据层也一起刷新
+    """
+    cache_key = get_stock_cache_key(ts_code)
     
-    # 优先检查24小时内的缓存
-    if is_cache_valid(cache_path):
-        logger.info(f"从24小时缓存读取 {ts_code}")
-        with open(cache_path, 'r', encoding='utf-8') as f:
-            cached_data = json.load(f)
-            cached_data['from_cache'] = True
-            return cached_data
+    # 优先检查缓存，卡片的每一层都有效时直接返回
+    cached_data = cache.get(cache_key)
+    if is_cache_valid(cached_data, lead):
+        logger.info(f"从缓存读取 {ts_code}")
+        cached_data['from_cache'] = True
+        return cached_data
     
-    # 缓存过期或不存在，从Tushare API获取
-    logger.info(f"缓存过期，从Tushare API获取 {ts_code}")
-    stock_info = get_stock_basic_info(ts_code)
+    # 缓存过期或不存在，重新组装，只从Tushare API获取过期的数据层
+    logger.info(f"缓存过期，重新组装 {ts_code}")
+    stock_info = get_stock_basic_info(ts_code, lead)
     
     if stock_info is None:
         logger.error(f"Tushare API获取失败: {ts_code}")
         # 如果API失败，检查是否有过期缓存可用
-        if os.path.exists(cache_path):
+        if cached_data:
             logger.info(f"API失败，使用过期缓存 {ts_code}")
-            with open(cache_path, 'r', encoding='utf-8') as f:
-                cached_data = json.load(f)
-                cached_data['from_cache'] = True
-                cached_data['cache_expired'] = True
-                return cached_data
+            cached_data['from_cache'] = True
+            cached_data['cache_expired'] = True
+            return cached_data
         else:
             # 完全无法获取数据
             return None
@@ -637,14 +946,15 @@ def get_stock_data(ts_code):
         'introduction': stock_info['business'].get('introduction', ''),
         'logo_url': f'https://gushitong.baidu.com/stock/logo/{stock_info["basic"]["symbol"]}.png',
         'historical_comparison': historical_comparison,  # 新增历史比较数据
+        'trade_date': stock_info['trade_date'],
+        'tiers': stock_info['tiers'],
         'cached_time': datetime.now().isoformat(),
         'from_cache': False
     }
     
     # 保存新缓存
     try:
-        with open(cache_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        cache.set(cache_key, data, ttl=CACHE_TTL * 2 * 3600)
         logger.info(f"已缓存股票数据: {ts_code}")
     except Exception as e:
         logger.error(f"保存缓存失败: {e}")
@@ -652,6 +962,315 @@ def get_stock_data(ts_code):
     return data
 
 
+def iter_export_records(industries=None, max_age_hours=None, cursor=None):
+    """逐只读取缓存中的股票数据和历史摘要，按代码顺序生成导出记录
+
+    industries: 行业名称集合，为空时不过滤
+    max_age_hours: 只导出缓存时间在该小时数之内的股票
+    cursor: 上次导出的最后一个股票代码，从其后一只继续
+    """
+    # 只保存代码列表用于排序，股票数据读一条输出一条
+    ts_codes = sorted(key[len(STOCK_DATA_PREFIX):] for key in cache.iter_keys(STOCK_DATA_PREFIX))
+    min_cached_time = datetime.now() - timedelta(hours=max_age_hours) if max_age_hours else None
+    
+    for ts_code in ts_codes:
+        if cursor and ts_code <= cursor:
+            continue
+        
+        card = cache.get(get_stock_cache_key(ts_code))
+        if not card:
+            continue
+        if industries and card.get('industry') not in industries:
+            continue
+        if min_cached_time:
+            try:
+                if datetime.fromisoformat(card['cached_time']) < min_cached_time:
+                    continue
+            except (KeyError, ValueError):
+                continue
+        
+        card.pop('from_cache', None)
+        historical = cache.get(get_historical_cache_key(ts_code)) or {}
+        yield {
+            'ts_code': ts_code,
+            'card': card,
+            'historical': {
+                'averages': historical.get('averages', {}),
+                'pe_count': len(historical.get('pe_data', [])),
+                'pb_count': len(historical.get('pb_data', [])),
+                'roe_data': historical.get('roe_data', []),
+                'debt_to_asset_data': historical.get('debt_to_asset_data', []),
+                'gross_profit_margin_data': historical.get('gross_profit_margin_data', []),
+                'cache_time': historical.get('cache_time')
+            } if historical else None
+        }
+
+
+def iter_fresh_cards():
+    """逐只生成缓存中仍然有效的股票卡片，用于生成快照"""
+    for key in sorted(cache.iter_keys(STOCK_DATA_PREFIX)):
+        card = cache.get(key)
+        if is_cache_valid(card):
+            card['from_cache'] = True
+            yield key[len(STOCK_DATA_PREFIX):], card
+
+
+def get_market_daily_basic():
+    """获取最新交易日全市场的估值数据（一次接口调用）
+
+    缓存中只保留一份，交易日变化时覆盖；获取失败时沿用上一次的数据
+    """
+    latest_trade_date, _ = get_latest_trade_dates()
+    cached_data = cache.get(DAILY_BASIC_KEY)
+    fallback = cached_data['stocks'] if cached_data else {}
+    if latest_trade_date is None:
+        return fallback
+    if cached_data and cached_data.get('trade_date') == latest_trade_date:
+        return cached_data['stocks']
+    
+    try:
+        logger.info(f"从Tushare获取全市场估值数据 {latest_trade_date}")
+        df = pro.daily_basic(ts_code='', trade_date=latest_trade_date,
+                             fields='ts_code,close,pe,pb,total_mv')
+        if df.empty:
+            # 收盘数据可能还未发布，不缓存空结果，下次重建选股表时重试
+            logger.warning(f"全市场估值数据为空: {latest_trade_date}")
+            return fallback
+        
+        stocks = {
+            row['ts_code']: {
+                'price': row['close'],
+                'pe': row['pe'],
+                'pb': row['pb'],
+                'market_value': round(row['total_mv'] / 10000, 2) if row['total_mv'] else None  # 转换为亿元
+            }
+            for row in df.to_dict('records')
+        }
+        cache.set(DAILY_BASIC_KEY, {'trade_date': latest_trade_date, 'stocks': stocks}, ttl=CACHE_TTL * 2 * 3600)
+        return stocks
+    except Exception as e:
+        logger.error(f"获取全市场估值数据失败: {e}")
+        return fallback
+
+
+def build_screener_table():
+    """合并股票列表、全市场估值和已缓存卡片中的基本面及历史均值，生成选股表
+
+    返回 (选股表, 输入是否完整)，股票列表或全市场估值为空时不完整
+    """
+    market = get_market_daily_basic()
+    stocks = get_stock_list()
+    records = []
+    for stock in stocks:
+        ts_code = stock['ts_code']
+        record = {'ts_code': ts_code, 'name': stock['name'], 'industry': stock['industry']}
+        
+        card = cache.get(get_stock_cache_key(ts_code))
+        if card:
+            financial = card.get('financial', {})
+            # 卡片中用0表示未获取到的指标，这里当作缺失
+            for field in ('pe', 'pb', 'roe', 'gross_profit_margin', 'debt_to_asset_ratio'):
+                record[field] = financial.get(field) or None
+            record['price'] = card.get('price') or None
+            record['pct_chg'] = card.get('pct_chg')
+            record['market_value'] = card.get('market_value') or None
+            record['holder_num'] = card.get('holder', {}).get('holder_num') or None
+            for metric, comparison in card.get('historical_comparison', {}).items():
+                record[f'{metric}_avg'] = comparison.get('historical_avg')
+        
+        # 全市场估值数据是最新交易日的，覆盖卡片中可能较旧的值
+        for field, value in market.get(ts_code, {}).items():
+            if value is not None and not pd.isna(value):
+                record[field] = value
+        records.append(record)
+    
+    return ScreenerTable.from_records(records), bool(stocks and market)
+
+
+# (选股表, 到期时间)
+_screener_table = (None, 0)
+_screener_lock = threading.Lock()
+
+
+def get_screener_table():
+    """获取选股表，超过 SCREENER_TTL 后重建；输入不完整时只保留 SCREENER_RETRY_SECONDS"""
+    global _screener_table
+    table, expires_at = _screener_table
+    if table is not None and time.time() < expires_at:
+        return table
+    
+    with _screener_lock:
+        table, expires_at = _screener_table
+        if table is None or time.time() >= expires_at:
+            logger.info("重建选股表...")
+            table, complete = build_screener_table()
+            if not complete:
+                logger.warning(f"股票列表或全市场估值为空，{SCREENER_RETRY_SECONDS} 秒后重建选股表")
+            _screener_table = (table, time.time() + (SCREENER_TTL if complete else SCREENER_RETRY_SECONDS))
+            logger.info(f"选股表重建完成，共 {len(table)} 只股票")
+    return table
+
+
+def parse_screener_ranges(args):
+    """解析 <字段>_min / <字段>_max 形式的区间条件"""
+    ranges = {}
+    for key, value in args.items():
+        if key.endswith('_min') or key.endswith('_max'):
+            field, bound = key[:-4], key[-3:]
+            if field not in NUMERIC_FIELDS:
+                raise ValueError(f"不支持的筛选字段: {field}")
+            low, high = ranges.get(field, (None, None))
+            if bound == 'min':
+                low = float(value)
+            else:
+                high = float(value)
+            ranges[field] = (low, high)
+    return ranges
+
+
+def record_access(ts_code, warm, weight=1):
+    """记录一次用户访问，并定期把本进程的计数写入缓存后端"""
+    access_tracker.record(ts_code, weight=weight, warm=warm)
+    if time.time() - _access_flushed_at >= HOTNESS_FLUSH_INTERVAL:
+        flush_access_counters()
+
+
+def flush_access_counters():
+    """把本进程的访问计数写入缓存后端，每个进程一个键"""
+    global _access_flushed_at
+    _access_flushed_at = time.time()
+    try:
+        cache.set(f'{HOTNESS_PREFIX}{socket.gethostname()}-{os.getpid()}', access_tracker.export(),
+                  ttl=HOTNESS_EXPORT_MAX_AGE)
+    except Exception as e:
+        logger.error(f"保存访问计数失败: {e}")
+
+
+def get_hot_stocks(n):
+    """汇总所有进程的访问计数，返回 ([(ts_code, 热度)], 命中缓存次数, 总访问次数)"""
+    flush_access_counters()
+    exports = []
+    now = time.time()
+    for key in list(cache.iter_keys(HOTNESS_PREFIX)):
+        data = cache.get(key)
+        if not data:
+            continue
+        if now - data['time'] > HOTNESS_EXPORT_MAX_AGE:
+            # 已退出的进程（如重启过的worker）留下的计数，文件缓存不会按TTL自动删除
+            cache.delete(key)
+            continue
+        exports.append(data)
+    scores, warm_hits, hits = merge_exports(exports, HOTNESS_HALF_LIFE_HOURS * 3600)
+    return top_stocks(scores, n), warm_hits, hits
+
+
+def prewarm_hot_stocks(top_n=PREWARM_TOP_N, budget=PREWARM_BUDGET):
+    """刷新最热门股票中已过期或即将过期的卡片，Tushare调用次数达到 budget 后停止"""
+    hot_stocks, _, _ = get_hot_stocks(top_n)
+    lead = timedelta(hours=PREWARM_LEAD_HOURS)
+    result = {'hot_stocks': len(hot_stocks), 'refreshed': 0, 'already_warm': 0,
+              'failed': 0, 'upstream_calls': 0, 'budget_exhausted': False}
+    
+    # 每次调用Tushare前检查预算，用完时中止当前股票
+    with call_budget(budget) as calls:
+        try:
+            for ts_code, _ in hot_stocks:
+                if is_cache_valid(cache.get(get_stock_cache_key(ts_code)), lead):
+                    result['already_warm'] += 1
+                    continue
+                
+                if get_stock_data(ts_code, lead) is None:
+                    result['failed'] += 1
+                else:
+                    result['refreshed'] += 1
+        except CallBudgetExceeded:
+            # 已完成的数据层各自写入了缓存，未完成的卡片留到下一轮
+            result['budget_exhausted'] = True
+    result['upstream_calls'] = calls.used
+    
+    logger.info(f"预热完成: {result}")
+    return result
+
+
+_prewarm_thread = None
+_prewarm_lock = threading.Lock()
+
+
+def start_prewarm_scheduler():
+    """在本进程中启动定时预热线程（只启动一次）"""
+    global _prewarm_thread
+    with _prewarm_lock:
+        if _prewarm_thread is not None:
+            return
+        
+        def run():
+            while True:
+                try:
+                    prewarm_hot_stocks()
+                except Exception as e:
+                    logger.error(f"预热失败: {e}")
+                time.sleep(PREWARM_INTERVAL)
+        
+        _prewarm_thread = threading.Thread(target=run, name='prewarm', daemon=True)
+        _prewarm_thread.start()
+        logger.info(f"已启动预热线程，间隔 {PREWARM_INTERVAL} 秒")
+
+
+def is_snapshot_card_fresh(ts_code, tiers):
+    """按快照索引中保存的分层时间戳判断快照里的卡片是否仍然有效"""
+    if not tiers:
+        return False
+    return is_cache_valid({'ts_code': ts_code, 'tiers': tiers})
+
+
+def parse_industries(value):
+    """解析逗号分隔的行业参数"""
+    return {item.strip() for item in value.split(',') if item.strip()} if value else None
+
+
+def is_profile_requested():
+    """检查当前请求是否要求CPU采样（需要管理员令牌）"""
+    if not ADMIN_TOKEN or request.args.get('profile') != '1':
+        return False
+    return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+
+
+@app.before_request
+def start_request_trace():
+    """按配置为请求开启追踪和CPU采样"""
+    # 在处理第一个请求时才启动预热线程，避免开发模式下重载器的父进程也启动
+    if PREWARM_ENABLED and _prewarm_thread is None:
+        start_prewarm_scheduler()
+    
+    profiling = is_profile_requested()
+    if TRACING_ENABLED or profiling:
+        start_trace(f'{request.method} {request.path}')
+    if profiling:
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+@app.after_request
+def finish_request_trace(response):
+    """输出 Server-Timing 头、追踪日志和CPU采样文件"""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile_name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}{request.path.replace('/', '_')}.prof"
+        profiler.dump_stats(os.path.join(PROFILE_DIR, profile_name))
+        response.headers['X-Profile-File'] = profile_name
+        logger.info(f"已保存CPU采样: {profile_name}")
+    
+    trace = end_trace()
+    if trace is not None:
+        response.headers['Server-Timing'] = trace.server_timing()
+        record = trace.to_record()
+        record['status'] = response.status_code
+        logger.info(f"请求追踪: {json.dumps(record, ensure_ascii=False)}", extra={'trace': record})
+    return response
+
+
 @app.route('/')
 def index():
     """提供前端页面"""
@@ -660,7 +1279,7 @@ def index():
 
 @app.route('/api/random-stock')
 def random_stock():
-    """获取随机股票（24小时缓存优先策略）"""
+    """获取随机股票（缓存优先策略）"""
     try:
         # 获取已浏览的股票列表
         viewed = request.args.get('viewed', '')
@@ -677,6 +1296,17 @@ def random_stock():
         if not available_stocks:
             return jsonify({'error': '所有股票已浏览完毕', 'all_viewed': True}), 404
         
+        # 优先从当日快照中随机取一张已编码好的卡片
+        with span('snapshot'):
+            deck = snapshot_store.current()
+            ts_code = None
+            if deck is not None:
+                ts_code = deck.random_code(exclude=set(viewed_list), is_fresh=is_snapshot_card_fresh)
+            raw = deck.get(ts_code) if ts_code else None
+        if raw is not None:
+            record_access(ts_code, warm=True, weight=0)
+            return Response(raw, mimetype='application/json')
+        
         # 尝试获取股票数据，最多尝试10次
         max_attempts = 10
         attempts = 0
@@ -690,8 +1320,11 @@ def random_stock():
             stock_data = get_stock_data(ts_code)
             
             if stock_data is not None:
-                # 成功获取数据
-                return jsonify(stock_data)
+                # 成功获取数据，随机抽到的股票只计入命中统计，不计入热度
+                warm = stock_data['from_cache'] and not stock_data.get('cache_expired')
+                record_access(ts_code, warm=warm, weight=0)
+                with span('serialize'):
+                    return jsonify(stock_data)
             else:
                 # 获取失败，从可用列表中移除这只股票，尝试下一只
                 logger.warning(f"无法获取股票 {ts_code} 的数据，尝试下一只")
@@ -710,41 +1343,185 @@ def random_stock():
 def get_stock(ts_code):
     """获取指定股票数据"""
     try:
+        with span('snapshot'):
+            deck = snapshot_store.current()
+            # 快照中的卡片已过期时回退到缓存和Tushare
+            raw = deck.get(ts_code, is_fresh=is_snapshot_card_fresh) if deck is not None else None
+        if raw is not None:
+            record_access(ts_code, warm=True)
+            return Response(raw, mimetype='application/json')
+        
         stock_data = get_stock_data(ts_code)
         
         if stock_data is None:
             return jsonify({'error': f'股票 {ts_code} 不存在或数据获取失败'}), 404
         
-        stock_data['from_cache'] = is_cache_valid(get_stock_cache_path(ts_code))
+        warm = stock_data['from_cache'] and not stock_data.get('cache_expired')
+        record_access(ts_code, warm=warm)
         
-        return jsonify(stock_data)
+        with span('serialize'):
+            return jsonify(stock_data)
     
     except Exception as e:
         logger.error(f"获取股票 {ts_code} 失败: {e}")
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/stock/<ts_code>/history')
+def get_history(ts_code):
+    """获取指定股票的历史估值走势（按点数降采样）"""
+    try:
+        # 未知代码直接返回404，避免为任意代码写入缓存（股票列表获取失败时不做限制）
+        stocks = get_stock_list()
+        if stocks and ts_code not in {stock['ts_code'] for stock in stocks}:
+            return jsonify({'error': f'股票 {ts_code} 不存在'}), 404
+        
+        # 点数只取固定档位，每只股票最多缓存 len(HISTORY_POINTS_LEVELS) 份结果
+        points = request.args.get('points', HISTORY_POINTS_DEFAULT, type=int)
+        points = next((level for level in HISTORY_POINTS_LEVELS if level >= points), HISTORY_POINTS_LEVELS[-1])
+        
+        history_data = get_stock_history(ts_code, points)
+        if history_data is None:
+            return jsonify({'error': f'股票 {ts_code} 历史数据获取失败'}), 404
+        
+        with span('serialize'):
+            return jsonify(history_data)
+    
+    except Exception as e:
+        logger.error(f"获取股票 {ts_code} 历史走势失败: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/screener')
+def screener():
+    """全市场选股：区间条件 + 行业 + 排序 + 分页"""
+    try:
+        try:
+            ranges = parse_screener_ranges(request.args)
+            sort = request.args.get('sort') or None
+            if sort and sort.lstrip('-') not in NUMERIC_FIELDS:
+                raise ValueError(f"不支持的排序字段: {sort}")
+            page = max(request.args.get('page', 1, type=int), 1)
+            page_size = max(1, min(request.args.get('page_size', 50, type=int), 200))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        table = get_screener_table()
+        with span('screen'):
+            result = table.screen(ranges, parse_industries(request.args.get('industry', '')),
+                                  sort, page, page_size)
+        for row in result['results']:
+            row['card_url'] = f"/api/stock/{row['ts_code']}"
+        
+        with span('serialize'):
+            return jsonify(result)
+    
+    except Exception as e:
+        logger.error(f"选股失败: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/favorites/touch', methods=['POST'])
+def touch_favorites():
+    """前端上报收藏列表，收藏的股票按更高权重计入热度"""
+    try:
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict) or not isinstance(payload.get('ts_codes'), list):
+            return jsonify({'error': '请求体应为 {"ts_codes": [...]}'}), 400
+        
+        # 只记录股票列表中存在的代码，避免任意字符串进入热度计数
+        listed = {stock['ts_code'] for stock in get_stock_list()}
+        ts_codes = [code for code in payload['ts_codes'] if isinstance(code, str) and code in listed][:200]
+        for ts_code in ts_codes:
+            record_access(ts_code, warm=None, weight=FAVORITE_WEIGHT)
+        return jsonify({'recorded': len(ts_codes)})
+    except Exception as e:
+        logger.error(f"记录收藏失败: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/stats')
 def stats():
     """获取统计信息"""
     try:
         stocks = get_stock_list()
-        cached_stocks = len([f for f in os.listdir(STOCK_DATA_DIR) if f.endswith('.json')])
+        cached_stocks = sum(1 for _ in cache.iter_keys(STOCK_DATA_PREFIX))
+        
+        # 热门股票中缓存有效的比例，以及用户访问命中有效缓存的比例
+        hot_stocks, warm_hits, hits = get_hot_stocks(PREWARM_TOP_N)
+        warm_hot_stocks = sum(
+            1 for ts_code, _ in hot_stocks
+            if is_cache_valid(cache.get(get_stock_cache_key(ts_code)))
+        )
         
         return jsonify({
             'total_stocks': len(stocks),
             'cached_stocks': cached_stocks,
-            'cache_hit_rate': round(cached_stocks / len(stocks) * 100, 2) if stocks else 0
+            'cache_hit_rate': round(cached_stocks / len(stocks) * 100, 2) if stocks else 0,
+            'hot_set_size': len(hot_stocks),
+            'hot_coverage': round(warm_hot_stocks / len(hot_stocks) * 100, 2) if hot_stocks else 0,
+            'warm_hit_rate': round(warm_hits / hits * 100, 2) if hits else 0
         })
     except Exception as e:
         logger.error(f"获取统计信息失败: {e}")
         return jsonify({'error': str(e)}), 500
 
 
-if __name__ == '__main__':
-    # 启动时清理过期缓存
-    logger.info("启动应用，清理过期缓存...")
-    clean_expired_cache()
+@app.route('/api/export')
+def export_cards():
+    """流式导出所有缓存股票（NDJSON，每行一只股票）"""
+    try:
+        industries = parse_industries(request.args.get('industry', ''))
+        max_age_hours = request.args.get('max_age', type=float)
+        cursor = request.args.get('cursor') or None
+        use_gzip = request.args.get('gzip', '').lower() in ('1', 'true')
+        
+        chunks = iter_ndjson(iter_export_records(industries, max_age_hours, cursor))
+        if use_gzip:
+            return Response(iter_gzip(chunks), mimetype='application/gzip', headers={
+                'Content-Disposition': 'attachment; filename=stocks.ndjson.gz'
+            })
+        return Response(chunks, mimetype='application/x-ndjson')
+    
+    except Exception as e:
+        logger.error(f"导出股票数据失败: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.cli.command('export-cards')
+@click.option('--industry', default='', help='按行业过滤，多个行业用逗号分隔')
+@click.option('--max-age', type=float, default=None, help='只导出缓存时间在该小时数之内的股票')
+@click.option('--cursor', default=None, help='从该股票代码之后继续导出')
+@click.option('--gzip', 'use_gzip', is_flag=True, help='gzip压缩输出')
+@click.option('--output', '-o', default='-', help='输出文件，默认标准输出')
+def export_cards_command(industry, max_age, cursor, use_gzip, output):
+    """流式导出所有缓存股票为NDJSON"""
+    chunks = iter_ndjson(iter_export_records(parse_industries(industry), max_age, cursor))
+    if use_gzip:
+        chunks = iter_gzip(chunks)
     
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    out = sys.stdout.buffer if output == '-' else open(output, 'wb')
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+        out.flush()
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+
+
+@app.cli.command('prewarm')
+@click.option('--top', 'top_n', type=int, default=PREWARM_TOP_N, help='预热最热门的N只股票')
+@click.option('--budget', type=int, default=PREWARM_BUDGET, help='最多使用的Tushare调用次数')
+def prewarm_command(top_n, budget):
+    """刷新热门股票中已过期或即将过期的卡片"""
+    result = prewarm_hot_stocks(top_n, budget)
+    click.echo(json.dumps(result, ensure_ascii=False))
+
+
+@app.cli.command('build-snapshot')
+def build_snapshot_command():
+    """把缓存中所有有效卡片打包成当日快照并发布"""
+    count = build_snapshot(SNAPSHOT_DIR, iter_fresh_cards())
+    click.echo(f"快照已发布，共 {count} 张卡片")
 
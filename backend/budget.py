@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+上游调用预算
+限制一段代码（如一轮预热）中对Tushare的调用次数，每次调用前检查，
+未设置预算的上下文只多一次ContextVar读取
+"""
+
+import contextvars
+from contextlib import contextmanager
+
+_current_budget = contextvars.ContextVar('call_budget', default=None)
+
+
+class CallBudgetExceeded(BaseException):
+    """调用次数用完了预算
+
+    继承BaseException，避免被数据获取函数里的 except Exception 当作普通失败吞掉后继续调用
+    """
+
+
+class CallBudget:
+    """一段代码内的调用计数"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+
+
+@contextmanager
+def call_budget(limit):
+    """在 with 块内限制经 BudgetedProxy 的调用次数：with call_budget(500) as budget: ..."""
+    budget = CallBudget(limit)
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
+
+
+class BudgetedProxy:
+    """包装对象，当前上下文设置了预算时，对其方法调用逐次计数，用完后抛出 CallBudgetExceeded"""
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            budget = _current_budget.get()
+            if budget is not None:
+                if budget.used >= budget.limit:
+                    raise CallBudgetExceeded(name)
+                budget.used += 1
+            return attr(*args, **kwargs)
+
+        return call
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+缓存后端
+提供统一的键值缓存接口，支持本地文件、SQLite共享库和Redis网络存储
+"""
+
+import fnmatch
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# mkstemp 创建的文件权限为0600，替换前改为按umask创建普通文件时的权限，
+# 以免用其他用户运行的定时任务写入的缓存文件服务进程读不到
+_umask = os.umask(0)
+os.umask(_umask)
+FILE_MODE = 0o666 & ~_umask
+
+
+class CacheBackend:
+    """缓存后端基类
+
+    键为形如 'stocks/000001.SZ' 的字符串，值为可JSON序列化的对象。
+    ttl 为存储层的过期时间（秒），为 None 时不过期；
+    业务层的数据新鲜度仍由调用方根据数据中的时间字段判断。
+    """
+
+    def get(self, key):
+        """读取缓存，不存在或已过期时返回None"""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        """写入缓存"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """删除缓存"""
+        raise NotImplementedError
+
+    def iter_keys(self, prefix=''):
+        """遍历指定前缀下的所有键"""
+        raise NotImplementedError
+
+    def purge_expired(self, prefix='', max_age=None):
+        """清理过期缓存，返回删除的条目数
+
+        max_age（秒）用于没有逐条TTL的后端，按最后写入时间清理。
+        """
+        return 0
+
+
+class FileCacheBackend(CacheBackend):
+    """本地文件缓存，每个键对应 <cache_dir>/<key>.json"""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, *key.split('/')) + '.json'
+
+    def get(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, ValueError) as e:
+            logger.error(f"缓存文件格式错误: {path}, 错误: {e}")
+            return None
+
+    def set(self, key, value, ttl=None):
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # 先写临时文件再原子替换，避免多进程读到写了一半的文件
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False, indent=2)
+            os.chmod(tmp_path, FILE_MODE)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def delete(self, key):
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def iter_keys(self, prefix=''):
+        directory = prefix.rpartition('/')[0]
+        base_dir = os.path.join(self.cache_dir, *directory.split('/')) if directory else self.cache_dir
+        if not os.path.isdir(base_dir):
+            return
+        for root, _, files in os.walk(base_dir):
+            rel_dir = os.path.relpath(root, self.cache_dir).replace(os.sep, '/')
+            for filename in files:
+                if not filename.endswith('.json'):
+                    continue
+                name = filename[:-len('.json')]
+                key = name if rel_dir == '.' else f'{rel_dir}/{name}'
+                if key.startswith(prefix):
+                    yield key
+
+    def purge_expired(self, prefix='', max_age=None):
+        if max_age is None:
+            return 0
+        now = time.time()
+        removed = 0
+        for key in list(self.iter_keys(prefix)):
+            path = self._path(key)
+            try:
+                if now - os.path.getmtime(path) > max_age:
+                    os.remove(path)
+                    removed += 1
+            except OSError as e:
+                logger.error(f"删除缓存文件失败 {path}: {e}")
+        return removed
+
+
+class SqliteCacheBackend(CacheBackend):
+    """SQLite缓存，同一台机器上的多个worker共享一个数据库文件"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+            'updated_at REAL NOT NULL, expires_at REAL)'
+        )
+        conn.commit()
+
+    def _conn(self):
+        # sqlite连接不能跨线程使用，每个线程单独建立连接
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            'SELECT value FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO cache (key, value, updated_at, expires_at) VALUES (?, ?, ?, ?)',
+            (key, json.dumps(value, ensure_ascii=False), now, now + ttl if ttl else None)
+        )
+        conn.commit()
+
+    def delete(self, key):
+        conn = self._conn()
+        conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+        conn.commit()
+
+    def iter_keys(self, prefix=''):
+        rows = self._conn().execute(
+            "SELECT key FROM cache WHERE key LIKE ? ESCAPE '\\' AND (expires_at IS NULL OR expires_at > ?)",
+            (_escape_like(prefix) + '%', time.time())
+        )
+        for (key,) in rows:
+            yield key
+
+    def purge_expired(self, prefix='', max_age=None):
+        now = time.time()
+        conn = self._conn()
+        pattern = _escape_like(prefix) + '%'
+        cur = conn.execute(
+            "DELETE FROM cache WHERE key LIKE ? ESCAPE '\\' AND expires_at IS NOT NULL AND expires_at <= ?",
+            (pattern, now)
+        )
+        removed = cur.rowcount
+        if max_age is not None:
+            cur = conn.execute(
+                "DELETE FROM cache WHERE key LIKE ? ESCAPE '\\' AND updated_at < ?",
+                (pattern, now - max_age)
+            )
+            removed += cur.rowcount
+        conn.commit()
+        return removed
+
+
+class RedisCacheBackend(CacheBackend):
+    """Redis网络缓存，多台服务器共享，过期由Redis原生TTL处理
+
+    client 需提供 get / set(ex=) / delete / scan_iter 方法，
+    可以是 redis.Redis 实例，也可以是 MemoryKVStore 这样的进程内替身。
+    """
+
+    def __init__(self, client, namespace='flashcard'):
+        self.client = client
+        self.namespace = namespace
+
+    @classmethod
+    def from_url(cls, url, namespace='flashcard'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("使用Redis缓存后端需要先安装 redis: pip install redis")
+        return cls(redis.Redis.from_url(url), namespace=namespace)
+
+    def _key(self, key):
+        return f'{self.namespace}:{key}'
+
+    def get(self, key):
+        raw = self.client.get(self._key(key))
+        if raw is None:
+            return None
+        if isinstance(raw, bytes):
+            raw = raw.decode('utf-8')
+        return json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self._key(key), json.dumps(value, ensure_ascii=False),
+                        ex=int(ttl) if ttl else None)
+
+    def delete(self, key):
+        self.client.delete(self._key(key))
+
+    def iter_keys(self, prefix=''):
+        strip = len(self.namespace) + 1
+        for raw in self.client.scan_iter(match=self._key(prefix) + '*'):
+            if isinstance(raw, bytes):
+                raw = raw.decode('utf-8')
+            yield raw[strip:]
+
+
+class MemoryKVStore:
+    """进程内键值存储，实现RedisCacheBackend用到的Redis命令子集
+
+    用于在没有Redis服务的环境中测试网络缓存后端。
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (value, time.time() + ex if ex else None)
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+    def ttl(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return -2
+            if item[1] is None:
+                return -1
+            return max(int(item[1] - time.time()), 0)
+
+    def scan_iter(self, match='*'):
+        with self._lock:
+            keys = list(self._data)
+        for key in keys:
+            if fnmatch.fnmatchcase(key, match) and self.get(key) is not None:
+                yield key
+
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def create_cache_backend(backend, cache_dir, url=''):
+    """根据配置创建缓存后端
+
+    backend: 'file'（默认）/ 'sqlite' / 'redis' / 'memory'
+    url: sqlite时为数据库文件路径，redis时为连接地址
+    """
+    if backend == 'file':
+        return FileCacheBackend(cache_dir)
+    if backend == 'sqlite':
+        return SqliteCacheBackend(url or os.path.join(cache_dir, 'cache.sqlite3'))
+    if backend == 'redis':
+        return RedisCacheBackend.from_url(url or 'redis://localhost:6379/0')
+    if backend == 'memory':
+        return RedisCacheBackend(MemoryKVStore())
+    raise ValueError(f"未知的缓存后端: {backend}")
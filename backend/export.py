@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""
+NDJSON导出
+把记录生成器逐条编码为NDJSON字节流，可选gzip压缩，内存占用与数据总量无关
+"""
+
+import json
+import zlib
+
+
+def iter_ndjson(records):
+    """每条记录编码为一行UTF-8 JSON"""
+    for record in records:
+        yield (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def iter_gzip(chunks, flush_every=64):
+    """流式gzip压缩，每 flush_every 个数据块刷新一次，保证下游能持续收到数据"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 生成gzip格式
+    pending = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        pending += 1
+        if pending >= flush_every:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+历史估值序列
+把历史PE/PB/ROE/毛利率等序列按日期整理，并用LTTB算法降采样到指定点数用于绘图
+"""
+
+import numpy as np
+
+# 降采样输出的指标及其在历史数据中的来源
+QUARTERLY_METRICS = {
+    'roe': ('roe_data', 'roe'),
+    'gross_profit_margin': ('gross_profit_margin_data', 'gross_profit_margin'),
+    'debt_to_asset_ratio': ('debt_to_asset_data', 'debt_to_assets'),
+}
+DAILY_METRICS = ('pe', 'pb')
+
+
+def lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Buckets 降采样，返回保留点的下标
+
+    保留首尾两点，中间每个桶选出与前一个已选点、后一个桶均值构成三角形面积最大的点，
+    能保留曲线的峰谷形状。桶均值用前缀和一次算出，桶内面积用NumPy向量计算。
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (threshold - 2)
+    edges = np.floor(np.arange(threshold - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+
+    # 每个桶的均值，最后一个桶的"下一桶"是末尾点
+    cum_x = np.concatenate(([0.0], np.cumsum(x)))
+    cum_y = np.concatenate(([0.0], np.cumsum(y)))
+    sizes = edges[1:] - edges[:-1]
+    avg_x = (cum_x[edges[1:]] - cum_x[edges[:-1]]) / sizes
+    avg_y = (cum_y[edges[1:]] - cum_y[edges[:-1]]) / sizes
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs(
+            (x[a] - next_x[i]) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (next_y[i] - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_series(dates, values, points):
+    """对一组 (日期, 数值) 去掉空值后降采样，日期格式为 YYYYMMDD"""
+    if not dates:
+        return {'dates': [], 'values': []}
+
+    date_arr = np.asarray(dates, dtype=str)
+    value_arr = np.asarray([np.nan if v is None else v for v in values], dtype=np.float64)
+    valid = ~np.isnan(value_arr)
+    date_arr = date_arr[valid]
+    value_arr = value_arr[valid]
+
+    order = np.argsort(date_arr, kind='stable')
+    date_arr = date_arr[order]
+    value_arr = value_arr[order]
+
+    # 用距1970年的天数作为横坐标，停牌等不连续的日期按实际间隔计算
+    ymd = date_arr.astype(np.int64)
+    days = ((ymd // 10000 - 1970).astype('datetime64[Y]').astype('datetime64[M]')
+            + (ymd // 100 % 100 - 1)).astype('datetime64[D]') + (ymd % 100 - 1)
+    x = days.astype(np.float64)
+    keep = lttb_indices(x, value_arr, points)
+    return {
+        'dates': date_arr[keep].tolist(),
+        'values': np.round(value_arr[keep], 2).tolist()
+    }
+
+
+def build_history_series(historical_data, points):
+    """从历史财务数据生成各指标的降采样序列"""
+    series = {}
+    valuation = historical_data.get('valuation_series') or {}
+    trade_dates = valuation.get('trade_date', [])
+    for metric in DAILY_METRICS:
+        series[metric] = downsample_series(trade_dates, valuation.get(metric, []), points)
+
+    for metric, (source, field) in QUARTERLY_METRICS.items():
+        items = historical_data.get(source, [])
+        series[metric] = downsample_series(
+            [str(item['end_date']) for item in items],
+            [item.get(field) for item in items],
+            points
+        )
+    return series
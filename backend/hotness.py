@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+访问热度
+按股票代码记录指数衰减的访问次数，用于找出热门股票并提前预热缓存
+"""
+
+import heapq
+import threading
+import time
+
+
+class AccessTracker:
+    """进程内的访问计数器
+
+    每只股票只保存 (分数, 更新时间)，分数按半衰期 half_life（秒）衰减，
+    条目超过 max_entries 的1.25倍时只保留分数最高的 max_entries 个。
+    同时按同样的半衰期统计缓存命中情况。
+    """
+
+    def __init__(self, half_life, max_entries=5000):
+        self.half_life = half_life
+        self.max_entries = max_entries
+        self._scores = {}
+        self._warm_hits = 0.0
+        self._hits = 0.0
+        self._hits_time = time.time()
+        self._lock = threading.Lock()
+
+    def _decay(self, value, since, now):
+        return value * 0.5 ** ((now - since) / self.half_life)
+
+    def record(self, ts_code, weight=1.0, warm=None, now=None):
+        """记录一次访问
+
+        weight 为0时只统计命中情况，不计入热度；
+        warm 表示这次是否命中了有效缓存，为None时不计入命中统计。
+        """
+        now = now or time.time()
+        with self._lock:
+            if weight:
+                entry = self._scores.get(ts_code)
+                score = self._decay(entry[0], entry[1], now) if entry else 0.0
+                self._scores[ts_code] = (score + weight, now)
+
+            if warm is not None:
+                factor = self._decay(1.0, self._hits_time, now)
+                self._warm_hits = self._warm_hits * factor + (1.0 if warm else 0.0)
+                self._hits = self._hits * factor + 1.0
+                self._hits_time = now
+
+            if len(self._scores) > self.max_entries * 1.25:
+                self._prune(now)
+
+    def _prune(self, now):
+        kept = heapq.nlargest(
+            self.max_entries, self._scores.items(),
+            key=lambda item: self._decay(item[1][0], item[1][1], now)
+        )
+        self._scores = dict(kept)
+
+    def __len__(self):
+        return len(self._scores)
+
+    def export(self, now=None):
+        """导出为可JSON序列化的字典，所有分数衰减到同一时间点"""
+        now = now or time.time()
+        with self._lock:
+            factor = self._decay(1.0, self._hits_time, now)
+            return {
+                'time': now,
+                'scores': {
+                    code: round(self._decay(score, updated_at, now), 4)
+                    for code, (score, updated_at) in self._scores.items()
+                },
+                'warm_hits': self._warm_hits * factor,
+                'hits': self._hits * factor
+            }
+
+
+def merge_exports(exports, half_life, now=None):
+    """合并多个进程导出的计数，返回 (分数字典, 命中缓存次数, 总访问次数)"""
+    now = now or time.time()
+    scores = {}
+    warm_hits = hits = 0.0
+    for data in exports:
+        factor = 0.5 ** ((now - data['time']) / half_life)
+        for code, score in data['scores'].items():
+            scores[code] = scores.get(code, 0.0) + score * factor
+        warm_hits += data.get('warm_hits', 0.0) * factor
+        hits += data.get('hits', 0.0) * factor
+    return scores, warm_hits, hits
+
+
+def top_stocks(scores, n):
+    """分数最高的 n 只股票，[(ts_code, 分数)]，从高到低"""
+    return heapq.nlargest(n, scores.items(), key=lambda item: item[1])
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+全市场选股
+把全市场的基本面、估值和历史均值整理成按列存放的NumPy表，
+组合区间条件用布尔掩码一次筛选
+"""
+
+import time
+
+import numpy as np
+
+# 可用于区间筛选和排序的数值字段
+BASE_FIELDS = (
+    'price', 'pct_chg', 'market_value', 'pe', 'pb', 'roe',
+    'gross_profit_margin', 'debt_to_asset_ratio', 'holder_num',
+)
+AVERAGE_METRICS = ('pe', 'pb', 'roe', 'gross_profit_margin', 'debt_to_asset_ratio')
+# <指标>_avg 为历史均值，<指标>_vs_avg 为当前值/历史均值（小于1表示低于历史均值）
+NUMERIC_FIELDS = (
+    BASE_FIELDS
+    + tuple(f'{m}_avg' for m in AVERAGE_METRICS)
+    + tuple(f'{m}_vs_avg' for m in AVERAGE_METRICS)
+)
+
+
+class ScreenerTable:
+    """全市场股票表，每个数值字段一列 float64，缺失值为NaN"""
+
+    def __init__(self, codes, names, industries, columns):
+        self.codes = codes
+        self.names = names
+        self.industries = industries
+        self.columns = columns
+        self.built_at = time.time()
+
+    def __len__(self):
+        return len(self.codes)
+
+    @classmethod
+    def from_records(cls, records):
+        """records: 含 ts_code/name/industry 和数值字段的字典列表，缺少的字段记为NaN"""
+        codes = np.array([r['ts_code'] for r in records], dtype=object)
+        names = np.array([r.get('name') or '' for r in records], dtype=object)
+        industries = np.array([r.get('industry') or '' for r in records], dtype=object)
+
+        columns = {}
+        for field in BASE_FIELDS + tuple(f'{m}_avg' for m in AVERAGE_METRICS):
+            columns[field] = np.array(
+                [_to_float(r.get(field)) for r in records], dtype=np.float64
+            )
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for metric in AVERAGE_METRICS:
+                avg = columns[f'{metric}_avg']
+                columns[f'{metric}_vs_avg'] = np.where(avg != 0, columns[metric] / avg, np.nan)
+        return cls(codes, names, industries, columns)
+
+    def screen(self, ranges=None, industries=None, sort=None, page=1, page_size=50):
+        """按条件筛选并分页
+
+        ranges: {字段: (最小值或None, 最大值或None)}，字段缺失（NaN）的股票不满足条件
+        industries: 行业名称集合
+        sort: 字段名，前缀'-'表示降序，缺失值始终排在最后
+        返回结果中的 coverage 是条件和排序用到的各字段有值的股票数，universe 是全部股票数
+        """
+        mask = np.ones(len(self.codes), dtype=bool)
+        for field, (low, high) in (ranges or {}).items():
+            column = self.columns[field]
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+        if industries:
+            mask &= np.isin(self.industries, list(industries))
+
+        matched = np.flatnonzero(mask)
+        if sort:
+            descending = sort.startswith('-')
+            values = self.columns[sort.lstrip('-')][matched]
+            # NaN在argsort中排在最后，降序时对取负后的值排序以保持这一点
+            order = np.argsort(-values if descending else values, kind='stable')
+            matched = matched[order]
+
+        start = (page - 1) * page_size
+        rows = matched[start:start + page_size]
+        used_fields = set(ranges or {})
+        if sort:
+            used_fields.add(sort.lstrip('-'))
+        return {
+            'total': int(len(matched)),
+            'universe': len(self.codes),
+            'coverage': {
+                field: int(np.count_nonzero(~np.isnan(self.columns[field])))
+                for field in sorted(used_fields)
+            },
+            'page': page,
+            'page_size': page_size,
+            'results': [self._row(i) for i in rows]
+        }
+
+    def _row(self, i):
+        row = {
+            'ts_code': self.codes[i],
+            'name': self.names[i],
+            'industry': self.industries[i],
+        }
+        for field, column in self.columns.items():
+            value = column[i]
+            row[field] = None if np.isnan(value) else round(float(value), 4)
+        return row
+
+
+def _to_float(value):
+    try:
+        return float(value) if value is not None else np.nan
+    except (TypeError, ValueError):
+        return np.nan
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+每日卡片快照
+把当天所有有效的卡片预先编码打包成一个文件，服务端通过mmap只读映射，
+多个worker进程经由操作系统页缓存共享同一份数据
+"""
+
+import json
+import mmap
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+import logging
+from datetime import datetime
+
+from .cache_backend import FILE_MODE
+
+logger = logging.getLogger(__name__)
+
+# 文件格式：MAGIC | 索引偏移(8字节) | 索引长度(8字节) | 卡片JSON... | 索引JSON
+SNAPSHOT_MAGIC = b'SFDECK01'
+HEADER = struct.Struct('<8sQQ')
+CURRENT_FILE = 'CURRENT'
+
+
+def build_snapshot(directory, cards, keep=2):
+    """把卡片写成快照文件并发布，返回写入的卡片数量
+
+    cards: 生成 (ts_code, card) 的可迭代对象，卡片逐条编码写入，不在内存中累积；
+           每张卡片的 tiers 时间戳写入索引，服务时据此逐张判断是否过期
+    keep: 保留最近几个快照文件，旧文件可能仍被其他进程映射，不立即删除
+    """
+    os.makedirs(directory, exist_ok=True)
+    # 文件名精确到微秒并带进程号，同一秒内多次发布也不会重名
+    name = f"deck-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{os.getpid()}.bin"
+    codes, offsets, lengths, tiers = [], [], [], []
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(SNAPSHOT_MAGIC, 0, 0))
+            offset = HEADER.size
+            for ts_code, card in cards:
+                blob = json.dumps(card, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+                f.write(blob)
+                codes.append(ts_code)
+                offsets.append(offset)
+                lengths.append(len(blob))
+                tiers.append(card.get('tiers'))
+                offset += len(blob)
+
+            index = json.dumps({
+                'created_time': datetime.now().isoformat(),
+                'codes': codes,
+                'offsets': offsets,
+                'lengths': lengths,
+                'tiers': tiers
+            }).encode('utf-8')
+            f.write(index)
+            f.seek(0)
+            f.write(HEADER.pack(SNAPSHOT_MAGIC, offset, len(index)))
+            f.flush()
+            os.fsync(f.fileno())
+        # 生成快照的定时任务和服务进程可能不是同一用户
+        os.chmod(tmp_path, FILE_MODE)
+        os.replace(tmp_path, os.path.join(directory, name))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    # 原子替换CURRENT指针，服务端下次检查时切换到新快照
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(name)
+    os.chmod(tmp_path, FILE_MODE)
+    os.replace(tmp_path, os.path.join(directory, CURRENT_FILE))
+
+    old_decks = sorted(n for n in os.listdir(directory) if n.startswith('deck-') and n.endswith('.bin'))
+    for old_name in old_decks[:-keep]:
+        try:
+            os.remove(os.path.join(directory, old_name))
+        except OSError as e:
+            logger.warning(f"删除旧快照失败 {old_name}: {e}")
+
+    logger.info(f"快照已发布: {name}, 共 {len(codes)} 张卡片")
+    return len(codes)
+
+
+class SnapshotDeck:
+    """一个已映射的快照文件"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_offset, index_length = HEADER.unpack_from(self._mm, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"不是有效的快照文件: {path}")
+        index = json.loads(self._mm[index_offset:index_offset + index_length])
+        self.created_time = datetime.fromisoformat(index['created_time'])
+        self.codes = index['codes']
+        self._index = {
+            code: (offset, length, card_tiers)
+            for code, offset, length, card_tiers in zip(
+                self.codes, index['offsets'], index['lengths'],
+                index.get('tiers') or [None] * len(self.codes)
+            )
+        }
+
+    def __len__(self):
+        return len(self.codes)
+
+    def get(self, ts_code, is_fresh=None):
+        """返回卡片的已编码JSON字节，不存在时返回None
+
+        is_fresh(ts_code, tiers): 判断卡片是否仍然有效，返回False时也返回None
+        """
+        entry = self._index.get(ts_code)
+        if entry is None:
+            return None
+        offset, length, card_tiers = entry
+        if is_fresh is not None and not is_fresh(ts_code, card_tiers):
+            return None
+        return self._mm[offset:offset + length]
+
+    def random_code(self, exclude=(), is_fresh=None, attempts=10):
+        """随机选一只不在 exclude 中且仍然有效的股票，多次尝试都不满足时返回None"""
+        if not self.codes:
+            return None
+        for _ in range(attempts):
+            ts_code = self.codes[random.randrange(len(self.codes))]
+            if ts_code in exclude:
+                continue
+            if is_fresh is not None and not is_fresh(ts_code, self._index[ts_code][2]):
+                continue
+            return ts_code
+        return None
+
+
+class SnapshotStore:
+    """跟踪快照目录中的CURRENT指针，发现新快照时原子切换"""
+
+    def __init__(self, directory, max_age_hours=24, check_interval=5):
+        self.directory = directory
+        self.max_age_hours = max_age_hours
+        self.check_interval = check_interval
+        self._deck = None
+        self._deck_name = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def _reload_if_needed(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            try:
+                with open(os.path.join(self.directory, CURRENT_FILE), 'r', encoding='utf-8') as f:
+                    name = f.read().strip()
+            except FileNotFoundError:
+                return
+            if name == self._deck_name:
+                return
+            try:
+                # 旧快照不主动关闭，仍在使用它的请求结束后随引用释放
+                self._deck = SnapshotDeck(os.path.join(self.directory, name))
+                self._deck_name = name
+                logger.info(f"切换到新快照: {name}, 共 {len(self._deck)} 张卡片")
+            except (OSError, ValueError) as e:
+                logger.error(f"加载快照失败 {name}: {e}")
+
+    def current(self):
+        """返回当前有效的快照，没有快照或快照已过期时返回None"""
+        self._reload_if_needed()
+        deck = self._deck
+        if deck is None:
+            return None
+        if (datetime.now() - deck.created_time).total_seconds() > self.max_age_hours * 3600:
+            return None
+        return deck
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+请求追踪
+记录单个请求内每次上游调用、缓存读写和序列化的耗时，
+未开启追踪时每次调用只多一次ContextVar读取
+"""
+
+import contextvars
+import time
+
+_current_trace = contextvars.ContextVar('request_trace', default=None)
+
+
+class RequestTrace:
+    """一个请求内的所有耗时记录"""
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.spans = []
+        self.duration = None
+
+    def add(self, name, duration, error=None):
+        self.spans.append((name, duration, error))
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+        return self
+
+    def summary(self):
+        """按名称汇总：{name: (次数, 总耗时秒)}，保持首次出现的顺序"""
+        totals = {}
+        for name, duration, _ in self.spans:
+            count, total = totals.get(name, (0, 0.0))
+            totals[name] = (count + 1, total + duration)
+        return totals
+
+    def server_timing(self):
+        """生成 Server-Timing 响应头"""
+        parts = [
+            f'{name};dur={total * 1000:.1f};desc="x{count}"'
+            for name, (count, total) in self.summary().items()
+        ]
+        if self.duration is not None:
+            parts.append(f'total;dur={self.duration * 1000:.1f}')
+        return ', '.join(parts)
+
+    def to_record(self):
+        """生成结构化日志记录"""
+        return {
+            'request': self.name,
+            'duration_ms': round((self.duration or 0) * 1000, 2),
+            'spans': [
+                {'name': name, 'duration_ms': round(duration * 1000, 2), 'error': error}
+                for name, duration, error in self.spans
+            ]
+        }
+
+
+def start_trace(name):
+    """为当前上下文开启追踪"""
+    trace = RequestTrace(name)
+    _current_trace.set(trace)
+    return trace
+
+
+def end_trace():
+    """结束当前上下文的追踪，返回追踪结果（未开启时返回None）"""
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    _current_trace.set(None)
+    return trace.finish()
+
+
+class span:
+    """记录一段代码的耗时：with span('serialize'): ..."""
+
+    __slots__ = ('name', 'trace', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.trace = _current_trace.get()
+        if self.trace is not None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.trace is not None:
+            self.trace.add(self.name, time.perf_counter() - self.start,
+                           exc_type.__name__ if exc_type else None)
+        return False
+
+
+class TracedProxy:
+    """包装对象，对其方法调用逐个计时，名称为 <prefix>.<方法名>"""
+
+    def __init__(self, target, prefix):
+        self._target = target
+        self._prefix = prefix
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+        span_name = f'{self._prefix}.{name}'
+
+        def call(*args, **kwargs):
+            trace = _current_trace.get()
+            if trace is None:
+                return attr(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                trace.add(span_name, time.perf_counter() - start, type(e).__name__)
+                raise
+            trace.add(span_name, time.perf_counter() - start)
+            return result
+
+        return call
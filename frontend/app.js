@@ -77,6 +77,7 @@ function init() {
     loadLocalData();
     updateStats();
     setupEventListeners();
+    reportFavorites();
     loadRandomStock();
     
     // 检查是否需要显示引导
@@ -113,6 +114,17 @@ function saveLocalData() {
     localStorage.setItem('favoriteStocks', JSON.stringify(favoriteStocks));
 }
 
+// 上报收藏列表，服务端会优先预热这些股票的数据
+function reportFavorites() {
+    if (favoriteStocks.length === 0) return;
+    
+    fetch(`${API_BASE_URL}/api/favorites/touch`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ts_codes: favoriteStocks.map(s => s.ts_code) })
+    }).catch(e => console.warn('上报收藏列表失败:', e));
+}
+
 // 更新统计信息
 function updateStats() {
     elements.viewedCount.textContent = viewedStocks.length;
@@ -279,7 +291,7 @@ function showFavorites() {
     } else {
         elements.favoritesList.innerHTML = favoriteStocks.map(stock => `
             <div class="favorite-item" data-ts-code="${stock.ts_code}">
-                <div class="favorite-info">
+                <div class="favorite-info" onclick="openFavorite('${stock.ts_code}')">
                     <div class="favorite-name">${stock.name}</div>
                     <div class="favorite-code">${stock.code}</div>
                 </div>
@@ -306,6 +318,41 @@ window.removeFavorite = function(ts_code) {
     showFavorites(); // 刷新列表
 };
 
+// 打开收藏的股票（通过 /api/stock 获取最新数据，服务端会优先预热收藏的股票）
+window.openFavorite = async function(ts_code) {
+    hideFavorites();
+    try {
+        elements.loading.classList.remove('hidden');
+        elements.card.style.opacity = '0';
+        
+        const response = await fetch(`${API_BASE_URL}/api/stock/${ts_code}`);
+        if (!response.ok) {
+            let errorMessage = `HTTP ${response.status}`;
+            try {
+                const error = await response.json();
+                errorMessage = error.error || errorMessage;
+            } catch (e) {
+                console.error('解析错误响应失败:', e);
+            }
+            throw new Error(errorMessage);
+        }
+        
+        const data = await response.json();
+        currentStock = data;
+        if (isFlipped) {
+            isFlipped = false;
+            elements.card.classList.remove('flipped');
+        }
+        updateCardUI(data);
+    } catch (error) {
+        console.error('加载收藏股票失败:', error);
+        alert(`加载失败：${error.message}`);
+    } finally {
+        elements.loading.classList.add('hidden');
+        elements.card.style.opacity = '1';
+    }
+};
+
 // 加载随机股票
 async function loadRandomStock() {
     try {
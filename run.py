@@ -10,7 +10,7 @@ import sys
 backend_dir = os.path.join(os.path.dirname(__file__), 'backend')
 sys.path.insert(0, backend_dir)
 
-from backend.app import app
+from backend.app import app, clean_expired_cache, logger
 
 if __name__ == '__main__':
     # 获取环境变量
@@ -27,5 +27,9 @@ if __name__ == '__main__':
     ╚══════════════════════════════════════════════╝
     """)
     
+    # 启动时清理过期缓存
+    logger.info("启动应用，清理过期缓存...")
+    clean_expired_cache()
+    
     app.run(host=host, port=port, debug=debug)
 
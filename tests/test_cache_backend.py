@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+缓存后端测试
+文件、SQLite和Redis（用MemoryKVStore代替Redis服务）三种后端的通用行为
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from backend.cache_backend import (
+    FileCacheBackend, MemoryKVStore, RedisCacheBackend, SqliteCacheBackend, create_cache_backend
+)
+
+
+class FakeClock:
+    """替换 cache_backend 模块中的 time，手动推进时间"""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+class BackendContract:
+    """各后端都应满足的行为，子类实现 make_backend"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.clock = FakeClock()
+        patcher = mock.patch('backend.cache_backend.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.backend = self.make_backend()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_get_missing_returns_none(self):
+        self.assertIsNone(self.backend.get('stocks/000001.SZ'))
+
+    def test_set_then_get(self):
+        value = {'name': '平安银行', 'price': 10.5, 'tags': ['银行']}
+        self.backend.set('stocks/000001.SZ', value)
+        self.assertEqual(self.backend.get('stocks/000001.SZ'), value)
+
+    def test_set_overwrites(self):
+        self.backend.set('stock_list', {'v': 1})
+        self.backend.set('stock_list', {'v': 2})
+        self.assertEqual(self.backend.get('stock_list'), {'v': 2})
+
+    def test_delete(self):
+        self.backend.set('stocks/000001.SZ', {'v': 1})
+        self.backend.delete('stocks/000001.SZ')
+        self.assertIsNone(self.backend.get('stocks/000001.SZ'))
+        # 删除不存在的键不报错
+        self.backend.delete('stocks/000001.SZ')
+
+    def test_iter_keys_by_prefix(self):
+        for key in ('stocks/000001.SZ', 'stocks/600000.SH', 'tiers/market/000001.SZ', 'stock_list'):
+            self.backend.set(key, {'key': key})
+        self.assertEqual(sorted(self.backend.iter_keys('stocks/')), ['stocks/000001.SZ', 'stocks/600000.SH'])
+        self.assertEqual(list(self.backend.iter_keys('tiers/')), ['tiers/market/000001.SZ'])
+        self.assertEqual(len(list(self.backend.iter_keys())), 4)
+
+    def test_iter_keys_prefix_is_literal(self):
+        # 前缀中的 _ 和 % 不能被当作通配符
+        self.backend.set('market/daily_basic', {})
+        self.backend.set('market/dailyxbasic', {})
+        self.assertEqual(list(self.backend.iter_keys('market/daily_')), ['market/daily_basic'])
+
+
+class TtlContract:
+    """支持逐条TTL的后端"""
+
+    def test_entry_expires_after_ttl(self):
+        self.backend.set('hotness/host-1', {'v': 1}, ttl=60)
+        self.backend.set('stock_list', {'v': 2})
+        self.clock.now += 59
+        self.assertEqual(self.backend.get('hotness/host-1'), {'v': 1})
+        self.clock.now += 2
+        self.assertIsNone(self.backend.get('hotness/host-1'))
+        self.assertEqual(list(self.backend.iter_keys('hotness/')), [])
+        self.assertEqual(self.backend.get('stock_list'), {'v': 2})
+
+
+class FileCacheBackendTest(BackendContract, unittest.TestCase):
+
+    def make_backend(self):
+        return FileCacheBackend(self.tmp_dir)
+
+    def test_ttl_is_not_enforced(self):
+        self.backend.set('stocks/000001.SZ', {'v': 1}, ttl=60)
+        self.clock.now += 3600
+        self.assertEqual(self.backend.get('stocks/000001.SZ'), {'v': 1})
+
+    def test_purge_expired_by_mtime(self):
+        self.backend.set('stocks/old', {'v': 1})
+        self.backend.set('stocks/new', {'v': 2})
+        self.backend.set('market/old', {'v': 3})
+        for key in ('stocks/old', 'market/old'):
+            path = self.backend._path(key)
+            os.utime(path, (self.clock.now - 7200, self.clock.now - 7200))
+        os.utime(self.backend._path('stocks/new'), (self.clock.now, self.clock.now))
+
+        self.assertEqual(self.backend.purge_expired('stocks/'), 0)
+        self.assertEqual(self.backend.purge_expired('stocks/', max_age=3600), 1)
+        self.assertEqual(sorted(self.backend.iter_keys()), ['market/old', 'stocks/new'])
+
+    def test_file_mode_follows_umask(self):
+        self.backend.set('stocks/000001.SZ', {'v': 1})
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = os.stat(self.backend._path('stocks/000001.SZ')).st_mode & 0o777
+        self.assertEqual(mode, 0o666 & ~umask)
+
+
+class SqliteCacheBackendTest(BackendContract, TtlContract, unittest.TestCase):
+
+    def make_backend(self):
+        return SqliteCacheBackend(os.path.join(self.tmp_dir, 'cache.sqlite3'))
+
+    def test_purge_expired(self):
+        self.backend.set('stocks/ttl', {'v': 1}, ttl=60)
+        self.backend.set('stocks/old', {'v': 2})
+        self.clock.now += 3600
+        self.backend.set('stocks/new', {'v': 3})
+        self.backend.set('market/old', {'v': 4}, ttl=60)
+        self.clock.now += 120
+
+        # 不传 max_age 时只清理TTL已到期的条目
+        self.assertEqual(self.backend.purge_expired('stocks/'), 1)
+        self.assertEqual(self.backend.purge_expired('stocks/', max_age=1800), 1)
+        self.assertEqual(list(self.backend.iter_keys('stocks/')), ['stocks/new'])
+        self.assertIsNone(self.backend.get('market/old'))
+
+    def test_shared_between_instances(self):
+        other = SqliteCacheBackend(os.path.join(self.tmp_dir, 'cache.sqlite3'))
+        self.backend.set('stock_list', {'v': 1})
+        self.assertEqual(other.get('stock_list'), {'v': 1})
+
+
+class RedisCacheBackendTest(BackendContract, TtlContract, unittest.TestCase):
+
+    def make_backend(self):
+        self.store = MemoryKVStore()
+        return RedisCacheBackend(self.store, namespace='test')
+
+    def test_keys_are_namespaced(self):
+        other = RedisCacheBackend(self.store, namespace='other')
+        self.backend.set('stock_list', {'v': 1})
+        self.assertIsNone(other.get('stock_list'))
+        self.assertEqual(list(self.store.scan_iter()), ['test:stock_list'])
+
+    def test_ttl_passed_to_store(self):
+        self.backend.set('hotness/host-1', {'v': 1}, ttl=90)
+        self.backend.set('stock_list', {'v': 2})
+        self.assertEqual(self.store.ttl('test:hotness/host-1'), 90)
+        self.assertEqual(self.store.ttl('test:stock_list'), -1)
+        self.assertEqual(self.store.ttl('test:missing'), -2)
+
+    def test_purge_expired_is_noop(self):
+        # 过期由存储自身的TTL处理
+        self.backend.set('stocks/000001.SZ', {'v': 1})
+        self.assertEqual(self.backend.purge_expired('stocks/', max_age=0), 0)
+
+
+class CreateCacheBackendTest(unittest.TestCase):
+
+    def test_create_by_name(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, True)
+        self.assertIsInstance(create_cache_backend('file', tmp_dir), FileCacheBackend)
+        self.assertIsInstance(create_cache_backend('sqlite', tmp_dir), SqliteCacheBackend)
+        self.assertIsInstance(create_cache_backend('memory', tmp_dir), RedisCacheBackend)
+        with self.assertRaises(ValueError):
+            create_cache_backend('memcached', tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+历史估值序列测试
+LTTB降采样与按日期整理序列
+"""
+
+import unittest
+
+import numpy as np
+
+from backend.history import build_history_series, downsample_series, lttb_indices
+
+
+def reference_lttb(x, y, threshold):
+    """逐点计算的LTTB，用来核对向量化实现"""
+    n = len(x)
+    every = (n - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        lo = int(np.floor(i * every)) + 1
+        hi = int(np.floor((i + 1) * every)) + 1
+        if i == threshold - 3:
+            hi = n - 1
+        next_lo, next_hi = hi, int(np.floor((i + 2) * every)) + 1
+        if i == threshold - 3:
+            avg_x, avg_y = x[-1], y[-1]
+        else:
+            if i == threshold - 4:
+                next_hi = n - 1
+            avg_x = np.mean(x[next_lo:next_hi])
+            avg_y = np.mean(y[next_lo:next_hi])
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+
+class LttbIndicesTest(unittest.TestCase):
+
+    def test_short_series_kept_whole(self):
+        x = np.arange(10, dtype=float)
+        self.assertEqual(lttb_indices(x, x, 10).tolist(), list(range(10)))
+        self.assertEqual(lttb_indices(x, x, 50).tolist(), list(range(10)))
+        self.assertEqual(lttb_indices(x, x, 2).tolist(), list(range(10)))
+
+    def test_keeps_endpoints_and_count(self):
+        rng = np.random.default_rng(0)
+        x = np.arange(1000, dtype=float)
+        y = rng.normal(size=1000).cumsum()
+        keep = lttb_indices(x, y, 60)
+        self.assertEqual(len(keep), 60)
+        self.assertEqual(keep[0], 0)
+        self.assertEqual(keep[-1], 999)
+        self.assertTrue(np.all(np.diff(keep) > 0))
+
+    def test_keeps_spike(self):
+        x = np.arange(1000, dtype=float)
+        y = np.zeros(1000)
+        y[437] = 100.0
+        self.assertIn(437, lttb_indices(x, y, 20).tolist())
+
+    def test_matches_reference(self):
+        rng = np.random.default_rng(1)
+        for n, threshold in ((100, 10), (1234, 120), (500, 499), (50, 3)):
+            x = np.sort(rng.uniform(0, 5000, size=n))
+            y = rng.normal(size=n).cumsum()
+            self.assertEqual(lttb_indices(x, y, threshold).tolist(), reference_lttb(x, y, threshold),
+                             f'n={n}, threshold={threshold}')
+
+
+class DownsampleSeriesTest(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual(downsample_series([], [], 60), {'dates': [], 'values': []})
+
+    def test_drops_missing_and_sorts_by_date(self):
+        result = downsample_series(
+            ['20240103', '20240101', '20240102', '20240104'],
+            [3.456, 1.0, None, float('nan')],
+            60
+        )
+        self.assertEqual(result, {'dates': ['20240101', '20240103'], 'values': [1.0, 3.46]})
+
+    def test_downsamples_to_points(self):
+        days = np.arange('2020-01-01', '2022-09-27', dtype='datetime64[D]')
+        dates = [str(day).replace('-', '') for day in days]
+        values = list(range(len(dates)))
+        result = downsample_series(dates, values, 60)
+        self.assertEqual(len(result['dates']), 60)
+        self.assertEqual(result['dates'][0], dates[0])
+        self.assertEqual(result['dates'][-1], dates[-1])
+        self.assertEqual(result['dates'], sorted(result['dates']))
+
+    def test_uses_calendar_gaps(self):
+        # 停牌造成的长间隔按实际天数计算，间隔两侧的点都应保留
+        dates = ['20230101', '20230102', '20230103', '20231201', '20231202', '20231203']
+        values = [1, 1, 1, 5, 5, 5]
+        result = downsample_series(dates, values, 4)
+        self.assertIn('20230103', result['dates'])
+        self.assertIn('20231201', result['dates'])
+
+
+class BuildHistorySeriesTest(unittest.TestCase):
+
+    def test_builds_all_metrics(self):
+        historical_data = {
+            'valuation_series': {
+                'trade_date': ['20240102', '20240103'],
+                'pe': [10.0, 11.0],
+                'pb': [1.0, None]
+            },
+            'roe_data': [{'end_date': 20231231, 'roe': 12.5}, {'end_date': 20230930, 'roe': 9.0}],
+            'gross_profit_margin_data': [{'end_date': '20231231', 'gross_profit_margin': 30.0}],
+        }
+        series = build_history_series(historical_data, 60)
+        self.assertEqual(set(series), {'pe', 'pb', 'roe', 'gross_profit_margin', 'debt_to_asset_ratio'})
+        self.assertEqual(series['pe']['values'], [10.0, 11.0])
+        self.assertEqual(series['pb'], {'dates': ['20240102'], 'values': [1.0]})
+        self.assertEqual(series['roe'], {'dates': ['20230930', '20231231'], 'values': [9.0, 12.5]})
+        self.assertEqual(series['debt_to_asset_ratio'], {'dates': [], 'values': []})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+选股表测试
+"""
+
+import unittest
+
+from backend.screener import NUMERIC_FIELDS, ScreenerTable
+
+
+RECORDS = [
+    {'ts_code': '000001.SZ', 'name': '平安银行', 'industry': '银行',
+     'pe': 5.0, 'pb': 0.6, 'roe': 11.0, 'pe_avg': 6.0},
+    {'ts_code': '600000.SH', 'name': '浦发银行', 'industry': '银行',
+     'pe': 4.0, 'pb': 0.4, 'roe': 8.0, 'pe_avg': 3.0},
+    {'ts_code': '000858.SZ', 'name': '五粮液', 'industry': '白酒',
+     'pe': 20.0, 'pb': 5.0, 'roe': 25.0, 'pe_avg': 30.0},
+    {'ts_code': '300750.SZ', 'name': '宁德时代', 'industry': '电池',
+     'pe': 'n/a', 'pb': 4.5},
+]
+
+
+def codes(result):
+    return [row['ts_code'] for row in result['results']]
+
+
+class ScreenerTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.table = ScreenerTable.from_records(RECORDS)
+
+    def test_from_records(self):
+        self.assertEqual(len(self.table), 4)
+        self.assertEqual(set(self.table.columns), set(NUMERIC_FIELDS))
+        row = self.table.screen(sort='-pb', page_size=1)['results'][0]
+        self.assertEqual(row['ts_code'], '000858.SZ')
+        self.assertAlmostEqual(row['pe_vs_avg'], 0.6667)
+        self.assertIsNone(row['holder_num'])
+
+    def test_range_conditions_skip_missing_values(self):
+        result = self.table.screen({'roe': (10, None), 'pe_vs_avg': (None, 1)})
+        self.assertEqual(codes(result), ['000001.SZ', '000858.SZ'])
+        # 无法解析的值按缺失处理
+        self.assertEqual(codes(self.table.screen({'pe': (0, None)})), ['000001.SZ', '600000.SH', '000858.SZ'])
+
+    def test_industries(self):
+        result = self.table.screen(industries={'银行', '电池'})
+        self.assertEqual(codes(result), ['000001.SZ', '600000.SH', '300750.SZ'])
+
+    def test_sort_keeps_missing_last(self):
+        self.assertEqual(codes(self.table.screen(sort='roe')),
+                         ['600000.SH', '000001.SZ', '000858.SZ', '300750.SZ'])
+        self.assertEqual(codes(self.table.screen(sort='-roe')),
+                         ['000858.SZ', '000001.SZ', '600000.SH', '300750.SZ'])
+
+    def test_pagination(self):
+        result = self.table.screen(sort='pb', page=2, page_size=3)
+        self.assertEqual(result['total'], 4)
+        self.assertEqual(codes(result), ['000858.SZ'])
+        self.assertEqual(self.table.screen(page=3, page_size=3)['results'], [])
+
+    def test_coverage(self):
+        result = self.table.screen({'roe': (0, None)}, sort='-pb')
+        self.assertEqual(result['universe'], 4)
+        self.assertEqual(result['coverage'], {'pb': 4, 'roe': 3})
+        self.assertEqual(self.table.screen()['coverage'], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+分层缓存有效期测试
+"""
+
+import os
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+# 测试中不读写本地缓存目录
+os.environ.setdefault('CACHE_BACKEND', 'memory')
+
+from backend import app as backend_app
+from backend.app import get_next_report_period, get_recent_report_periods, is_tier_fresh
+
+
+def frozen_at(now):
+    """把 backend.app 中的 datetime.now() 固定为 now"""
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now
+
+    return mock.patch.object(backend_app, 'datetime', FrozenDatetime)
+
+
+NOW = datetime(2024, 5, 10, 10, 0)
+
+
+def stamped(hours_ago, **fields):
+    return dict(fields, data={}, fetched_time=(NOW - timedelta(hours=hours_ago)).isoformat())
+
+
+class ReportPeriodTest(unittest.TestCase):
+
+    def test_next_report_period(self):
+        self.assertEqual(get_next_report_period('20240331'), '20240630')
+        self.assertEqual(get_next_report_period('20240930'), '20241231')
+        self.assertEqual(get_next_report_period('20241231'), '20250331')
+
+    def test_recent_report_periods(self):
+        with frozen_at(NOW):
+            self.assertEqual(get_recent_report_periods(),
+                             ['20240331', '20231231', '20230930', '20230630', '20230331'])
+        with frozen_at(datetime(2024, 1, 15)):
+            self.assertEqual(get_recent_report_periods(2), ['20231231', '20230930'])
+        with frozen_at(datetime(2024, 12, 31)):
+            self.assertEqual(get_recent_report_periods(1), ['20240930'])
+
+
+class IsTierFreshTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = frozen_at(NOW)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_missing_entry(self):
+        self.assertFalse(is_tier_fresh('profile', None, '20240509'))
+        self.assertFalse(is_tier_fresh('profile', {'data': {}}, '20240509'))
+
+    def test_market_follows_trade_date(self):
+        entry = stamped(30, trade_date='20240509')
+        self.assertTrue(is_tier_fresh('market', entry, '20240509'))
+        self.assertFalse(is_tier_fresh('market', entry, '20240510'))
+        # 新交易日的数据发布前不因 lead 提前过期
+        self.assertTrue(is_tier_fresh('market', entry, '20240509', lead=timedelta(hours=2)))
+
+    def test_market_without_calendar_uses_age(self):
+        self.assertTrue(is_tier_fresh('market', stamped(23, trade_date='20240509'), None))
+        self.assertFalse(is_tier_fresh('market', stamped(25, trade_date='20240509'), None))
+
+    def test_fundamentals_until_next_period_ends(self):
+        # 2024Q2 尚未结束，2024Q1 的数据不会过期
+        self.assertTrue(is_tier_fresh('fundamentals', stamped(24 * 30, period='20240331'), None))
+        # 2024Q1 已结束，仍是 2023 年报时每 FUNDAMENTALS_RECHECK_HOURS 检查一次
+        self.assertTrue(is_tier_fresh('fundamentals', stamped(23, period='20231231'), None))
+        self.assertFalse(is_tier_fresh('fundamentals', stamped(25, period='20231231'), None))
+        self.assertFalse(is_tier_fresh('fundamentals', stamped(1, period='20231231'), None,
+                                       lead=timedelta(hours=24)))
+
+    def test_ttl_tiers(self):
+        self.assertTrue(is_tier_fresh('holder', stamped(24 * 6), None))
+        self.assertFalse(is_tier_fresh('holder', stamped(24 * 8), None))
+        self.assertTrue(is_tier_fresh('profile', stamped(24 * 29), None))
+        self.assertFalse(is_tier_fresh('profile', stamped(24 * 29), None, lead=timedelta(days=2)))
+
+    def test_failed_refresh_waits_for_retry(self):
+        retry_after = (NOW + timedelta(minutes=30)).isoformat()
+        entry = {'data': {'holder_num': 0}, 'retry_after': retry_after}
+        self.assertTrue(is_tier_fresh('holder', entry, None))
+        self.assertFalse(is_tier_fresh('holder', entry, None, lead=timedelta(hours=1)))
+
+        # 重试时间过后按原有的时间戳判断
+        past = (NOW - timedelta(minutes=1)).isoformat()
+        self.assertFalse(is_tier_fresh('holder', {'data': {}, 'retry_after': past}, None))
+        self.assertFalse(is_tier_fresh('market', stamped(30, trade_date='20240508', retry_after=past), '20240509'))
+
+
+if __name__ == '__main__':
+    unittest.main()